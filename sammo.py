@@ -11,7 +11,13 @@ from datetime import datetime
 
 from qgis.PyQt.QtCore import Qt, QUrl
 from qgis.PyQt.QtGui import QKeySequence, QDesktopServices, QIcon
-from qgis.PyQt.QtWidgets import QToolBar, QShortcut, QTableView, QAction
+from qgis.PyQt.QtWidgets import (
+    QAction,
+    QToolBar,
+    QShortcut,
+    QTableView,
+    QMessageBox,
+)
 
 from qgis.core import (
     QgsProject,
@@ -22,7 +28,7 @@ from qgis.core import (
     QgsFeatureRequest,
 )
 
-from .src.core.gps import SammoGpsReader
+from .src.core.gps import SammoGpsReader, SammoNmeaReplay
 from .src.core.session import SammoSession
 from .src.core.utils import shortcutCreation
 from .src.core.thread_simu_gps import ThreadSimuGps
@@ -32,6 +38,7 @@ from .src.core.sound_recording_controller import (
 )
 
 from .src.gui.save import SammoSaveAction
+from .src.gui.follow import SammoMapFollower, SammoLiveTrack
 from .src.gui.table import SammoTableDock
 from .src.gui.status import SammoStatusDock
 from .src.gui.export import SammoExportAction
@@ -52,7 +59,6 @@ class Sammo:
         self.toolbar.setObjectName("Sammo ToolBar")
         self.filterExpr: str = "True"
 
-        self.gps_wait = False
         self.loading = False
         self.session = SammoSession()
 
@@ -81,6 +87,8 @@ class Sammo:
         )
         self.statusDock.activateGPS.connect(self.activateGPS)
         self.tableDock = SammoTableDock(iface)
+        self.mapFollower = SammoMapFollower(iface.mapCanvas())
+        self.liveTrack = SammoLiveTrack(iface.mapCanvas(), self.reloadGps)
 
         iface.projectRead.connect(self.onProjectLoaded)
         iface.newProjectCreated.connect(self.onProjectLoaded)
@@ -137,7 +145,7 @@ class Sammo:
         return [button, threadGps]
 
     def createGpsReader(self) -> SammoGpsReader:
-        gps = SammoGpsReader()
+        gps = SammoNmeaReplay.fromEnvironment() or SammoGpsReader()
         gps.start()
         return gps
 
@@ -230,12 +238,42 @@ class Sammo:
         self.csvInitAction = QAction("Open init data folder")
         self.csvInitAction.triggered.connect(self.initDataFolder)
         self.iface.addPluginToMenu("Sammo-Boat", self.csvInitAction)
+        self.repairAction = QAction("Repair missing geometries")
+        self.repairAction.triggered.connect(self.repairGeometries)
+        self.iface.addPluginToMenu("Sammo-Boat", self.repairAction)
+        self.queryPlansAction = QAction("Show database query plans")
+        self.queryPlansAction.triggered.connect(self.showQueryPlans)
+        self.iface.addPluginToMenu("Sammo-Boat", self.queryPlansAction)
 
     def initDataFolder(self) -> None:
         QDesktopServices.openUrl(
             QUrl.fromLocalFile((Path(__file__).parent / "data").as_posix())
         )
 
+    def repairGeometries(self) -> None:
+        if not self.session.environmentLayer:
+            return
+        report = self.session.repairGeometries()
+        lines = [
+            f"{name}: {repaired} repaired, {unlocated} without GPS track"
+            for name, (repaired, unlocated) in report.items()
+        ]
+        QMessageBox.information(
+            self.mainWindow, "Repair missing geometries", "\n".join(lines)
+        )
+        self.filterTable()
+
+    def showQueryPlans(self) -> None:
+        if not self.session.db.directory:
+            return
+        lines = []
+        for query, plan in self.session.db.queryPlans().items():
+            lines.append(query)
+            lines += [f"    {detail}" for detail in plan]
+        QMessageBox.information(
+            self.mainWindow, "Database query plans", "\n".join(lines)
+        )
+
     def initShortcuts(self) -> None:
         self.environmentShortcut = QShortcut(
             QKeySequence("Shift+E"), self.mainWindow
@@ -302,6 +340,7 @@ class Sammo:
     def unload(self):
         self.activateGPS()  # add End environment Status if needed
         self.gpsReader.stop()
+        self.session.close()
 
         if self.threadSimuGps is not None and self.threadSimuGps.isProceeding:
             self.threadSimuGps.stop()
@@ -322,6 +361,8 @@ class Sammo:
 
         self.statusDock.unload()
         self.tableDock.unload()
+        self.mapFollower.unload()
+        self.liveTrack.unload()
         del self.statusDock
         del self.toolbar
 
@@ -353,7 +394,22 @@ class Sammo:
     def saveAll(self) -> None:
         self.session.saveAll()
 
+    def reloadGps(self) -> None:
+        if self.session.gpsLayer:
+            self.session.gpsLayer.triggerRepaint()
+
     def validate(self) -> None:
+        report = self.session.effortCheck(
+            self.session.environmentLayer,
+            self.session.sightingsLayer,
+            self.session.followersLayer,
+        )
+        if not report.ok:
+            QMessageBox.warning(
+                self.mainWindow,
+                "Errors detected in effort status",
+                report.text() + "\nPlease, resolve errors before validation",
+            )
         self.session.validate()
         self.session.saveAll()
         self.tableDock.refresh(
@@ -372,90 +428,78 @@ class Sammo:
         s: int,
         speed: float = -9999.0,
         course: float = -9999.0,
+        msec: int = 0,
+        year: int = -1,
+        month: int = -1,
+        day: int = -1,
     ) -> None:
-        updated = True
+        # each frame is a complete fix (RMC/GGA sentences of a same epoch are
+        # merged by the GPS worker)
         now = datetime.now()
-        gpsNow = datetime(now.year, now.month, now.day, h, m, s)
+        try:
+            gpsNow = datetime(year, month, day, h, m, s, msec * 1000)
+        except ValueError:
+            # no date received with the fix: the date of the computer is used
+            gpsNow = datetime(
+                now.year, now.month, now.day, h, m, s, msec * 1000
+            )
+        if self.session.lastGpsInfo["datetime"] == gpsNow:
+            return
 
-        if self.session.lastGpsInfo["datetime"] == gpsNow and (
-            speed != -9999.0 or course != -9999.0
+        self.session.lastGpsInfo["geometry"] = QgsGeometry.fromPointXY(
+            QgsPointXY(longitude, latitude)
+        )
+        self.session.lastGpsInfo["datetime"] = gpsNow
+        if (
+            speed != -9999.0
+            or course != -9999.0
+            or (
+                gpsNow - self.session.lastGpsInfo["gprmc"]["datetime"]
+            ).total_seconds()
+            > 59
         ):
-            # a GPRMC frame is coming after a GPGGA frame with the same
-            # datetime but speed/course are valid
             self.session.lastGpsInfo["gprmc"]["speed"] = speed
             self.session.lastGpsInfo["gprmc"]["course"] = course
             self.session.lastGpsInfo["gprmc"]["datetime"] = now
-        elif self.session.lastGpsInfo["datetime"] != gpsNow:
-            # a newer GPRMC/GPGGA frame is coming
-            self.session.lastGpsInfo["geometry"] = QgsGeometry.fromPointXY(
-                QgsPointXY(longitude, latitude)
-            )
-            self.session.lastGpsInfo["datetime"] = gpsNow
-            if (
-                speed != -9999.0
-                or course != -9999.0
-                or (
-                    gpsNow - self.session.lastGpsInfo["gprmc"]["datetime"]
-                ).total_seconds()
-                > 59
-            ):
-                self.session.lastGpsInfo["gprmc"]["speed"] = speed
-                self.session.lastGpsInfo["gprmc"]["course"] = course
-                self.session.lastGpsInfo["gprmc"]["datetime"] = now
-        else:
-            # we don't need to update GPS info in status panel (offline status
-            # is managed internally by the panel)
-            updated = False
+
+        self.session.addTrack(
+            gpsNow,
+            longitude,
+            latitude,
+            self.session.lastGpsInfo["gprmc"]["speed"],
+            self.session.lastGpsInfo["gprmc"]["course"],
+        )
 
         if (
             not self.session.lastCaptureTime
-            or (gpsNow - self.session.lastCaptureTime).total_seconds() > 59
+            or (gpsNow - self.session.lastCaptureTime).total_seconds()
+            >= self.session.captureInterval
         ):
-            # Wait for one more frame in case we retrieve the speed/course at
-            # the next frame. Worst case scenario: we lose 1 frame in database
-            if (
-                self.session.lastGpsInfo["gprmc"]["speed"] == -9999.0
-                and self.session.lastGpsInfo["gprmc"]["course"] == -9999.0
-            ):
-                # False -> True: speed/course are invalid so we want to wait 1
-                # more frame
-                # True -> False: speed/course are invalid but we already waited
-                # for another frame.
-                self.gps_wait = not self.gps_wait
-            else:
-                # speed/course are valid so we don't need to wait for another
-                # frame to come
-                self.gps_wait = False
-
-            # we udpate the database if we don't need to wait for speed/course
-            if not self.gps_wait:
-                self.session.addGps(
-                    longitude,
-                    latitude,
-                    h,
-                    m,
-                    s,
-                    self.session.lastGpsInfo["gprmc"]["speed"],
-                    self.session.lastGpsInfo["gprmc"]["course"],
-                )
-                self.session.lastCaptureTime = gpsNow
-
-        # Panel status is updated only if neccessary. This check is necessary
-        # because if we receive a GPGGA after a GPRMC for the same datetime,
-        # then speed/course are not valid in this call (so we don't want to
-        # update the panel).
-        if updated:
-            self.iface.mapCanvas().setCenter(QgsPointXY(longitude, latitude))
-            self.statusDock.updateGpsInfo(
+            self.session.addGps(
                 longitude,
                 latitude,
+                h,
+                m,
+                s,
                 self.session.lastGpsInfo["gprmc"]["speed"],
                 self.session.lastGpsInfo["gprmc"]["course"],
             )
+            self.session.lastCaptureTime = gpsNow
+
+        self.mapFollower.update(longitude, latitude)
+        self.liveTrack.add(longitude, latitude)
+        self.statusDock.updateGpsInfo(
+            longitude,
+            latitude,
+            self.session.lastGpsInfo["gprmc"]["speed"],
+            self.session.lastGpsInfo["gprmc"]["course"],
+        )
 
     def onCreateSession(self, sessionDirectory: str) -> None:
         # init session
         self.loading = True
+        self.session.close()
+        self.liveTrack.reset()
         QgsProject.instance().clear()
         self.tableDock.clean()
         self.session.init(sessionDirectory)
@@ -642,6 +686,8 @@ class Sammo:
         if not sessionDir:
             self.soundRecordingController.interruptRecording()
             self.soundRecordingController.unload()
+            self.session.close()
+            self.liveTrack.reset()
             self.session = SammoSession()
             self.statusDock.session = self.session
             self.settingsAction.session = self.session
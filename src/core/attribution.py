@@ -0,0 +1,128 @@
+# coding: utf8
+
+__contact__ = "info@hytech-imaging.fr"
+__copyright__ = "Copyright (c) 2022 Hytech Imaging"
+
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from qgis.PyQt.QtCore import QDateTime
+from qgis.core import QgsVectorLayer, QgsFeatureRequest
+
+from .logger import Logger
+
+# effort attributes of an observation, copied from its environment record
+EFFORT = ["_effortGroup", "_effortLeg"]
+
+# environment attribute giving the observer of a sighting, by side
+OBSERVERS = {"L": "left", "R": "right", "C": "center"}
+
+
+def _msecs(value) -> Optional[int]:
+    if isinstance(value, QDateTime) and value.isValid():
+        return value.toMSecsSinceEpoch()
+    return None
+
+
+class SammoEnvironmentIntervals:
+    """
+    Environment records sorted by datetime. An observation belongs to the
+    interval of the last environment record strictly before it.
+
+    Records are loaded once, and the interval of many observations is
+    found with a single binary search on the datetimes.
+    """
+
+    def __init__(self, layer: QgsVectorLayer):
+        names = ["dateTime"] + EFFORT + list(OBSERVERS.values())
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(names, layer.fields())
+
+        epochs = []
+        self.records: List[Dict] = []
+        for feature in layer.getFeatures(request):
+            msecs = _msecs(feature["dateTime"])
+            if msecs is None:
+                continue
+            epochs.append(msecs)
+            self.records.append({name: feature[name] for name in names[1:]})
+
+        # records with a same datetime keep their order, the last one wins
+        order = np.argsort(np.asarray(epochs, dtype=np.int64), kind="stable")
+        self.epochs = np.asarray(epochs, dtype=np.int64)[order]
+        self.records = [self.records[i] for i in order]
+
+    def indexes(self, epochs: np.ndarray) -> np.ndarray:
+        """
+        Index of the record of each epoch in milliseconds, -1 if there's no
+        record before
+        """
+        return np.searchsorted(self.epochs, epochs, side="left") - 1
+
+    def apply(self, layer: QgsVectorLayer, attributes: List[str]) -> int:
+        """
+        Copies attributes (effort attributes or the observer of the side of
+        a sighting) of their environment record to the observations of a
+        layer. Only the observations with a different value are changed,
+        and they are committed at once. Returns the number of observations
+        changed.
+        """
+        start = time.perf_counter()
+        fields = layer.fields()
+        names = {name: fields.indexOf(name) for name in attributes}
+
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(
+            ["dateTime", "side"] + list(names), fields
+        )
+
+        layer.startEditing()
+        features = []
+        epochs = []
+        for feature in layer.getFeatures(request):
+            msecs = _msecs(feature["dateTime"])
+            if msecs is None:
+                continue
+            features.append(feature)
+            # datetimes of observations are compared to the second
+            epochs.append(msecs - msecs % 1000)
+
+        changed = 0
+        indexes = self.indexes(np.asarray(epochs, dtype=np.int64))
+        for feature, index in zip(features, indexes):
+            if index < 0:
+                continue
+            record = self.records[index]
+
+            values = {}
+            for name, idx in names.items():
+                if name == "observer":
+                    source = OBSERVERS.get(feature["side"])
+                    if not source:
+                        continue
+                else:
+                    source = name
+                if feature[name] != record[source]:
+                    values[idx] = record[source]
+
+            if values:
+                old = {idx: feature.attribute(idx) for idx in values}
+                layer.changeAttributeValues(feature.id(), values, old)
+                changed += 1
+
+        if changed and not layer.commitChanges():
+            Logger.error(
+                f"Unable to save {layer.name()}: "
+                + ", ".join(layer.commitErrors())
+            )
+        layer.startEditing()
+
+        Logger.log(
+            f"{layer.name()}: {changed} / {len(features)} records attributed "
+            f"in {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+        return changed
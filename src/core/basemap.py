@@ -0,0 +1,111 @@
+# coding: utf8
+
+__contact__ = "info@hytech-imaging.fr"
+__copyright__ = "Copyright (c) 2022 Hytech Imaging"
+
+import os
+from pathlib import Path
+from typing import List
+
+from qgis.core import (
+    QgsFeature,
+    QgsApplication,
+    QgsVectorLayer,
+    QgsVectorFileWriter,
+    QgsCoordinateTransformContext,
+)
+
+from .logger import Logger
+
+# to be increased when the levels change, so that the basemap is rebuilt
+BASEMAP_VERSION = 1
+
+# simplification tolerance in degrees of each level, and the scale range
+# (most zoomed out, most zoomed in) where it is displayed, 0 meaning no
+# limit
+LEVELS = [
+    (0.0, 2e6, 0),
+    (0.005, 1e7, 2e6),
+    (0.02, 5e7, 1e7),
+    (0.1, 0, 5e7),
+]
+
+
+def levelName(level: int) -> str:
+    return f"world_{level}"
+
+
+def basemapPath() -> Path:
+    """
+    Returns the path of the shared basemap, built if needed. The basemap
+    is stored once in the QGIS profile and referenced by all the sessions,
+    so its path doesn't depend on the QGIS version and previous basemaps
+    are kept for the sessions still referencing them.
+    """
+    folder = Path(QgsApplication.qgisSettingsDirPath()) / "sammo-boat"
+    path = folder / f"basemap-{BASEMAP_VERSION}.gpkg"
+    if path.exists():
+        return path
+
+    folder.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp.gpkg")
+    if tmp.exists():
+        tmp.unlink()
+    _build(tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def levelUris() -> List[str]:
+    path = basemapPath().as_posix()
+    return [f"{path}|layername={levelName(i)}" for i in range(len(LEVELS))]
+
+
+def _build(path: Path) -> None:
+    world = QgsVectorLayer(worldMapPath(), "World")
+    features = list(world.getFeatures())
+
+    for level, (tolerance, _, _) in enumerate(LEVELS):
+        opts = QgsVectorFileWriter.SaveVectorOptions()
+        opts.driverName = "GPKG"
+        opts.layerName = levelName(level)
+        if level == 0:
+            opts.actionOnExistingFile = (
+                QgsVectorFileWriter.CreateOrOverwriteFile
+            )
+        else:
+            opts.actionOnExistingFile = (
+                QgsVectorFileWriter.CreateOrOverwriteLayer
+            )
+        writer = QgsVectorFileWriter.create(
+            path.as_posix(),
+            world.fields(),
+            world.wkbType(),
+            world.crs(),
+            QgsCoordinateTransformContext(),
+            opts,
+        )
+
+        simplified = []
+        for feature in features:
+            geometry = feature.geometry()
+            if tolerance and not geometry.isNull():
+                geometry = geometry.simplify(tolerance)
+                if geometry.isEmpty():
+                    continue
+            ft = QgsFeature(feature)
+            ft.setGeometry(geometry)
+            simplified.append(ft)
+        writer.addFeatures(simplified)
+        del writer
+
+    Logger.log(f"Basemap built in {path}")
+
+
+def worldMapPath() -> str:
+    return (
+        Path(QgsApplication.instance().pkgDataPath())
+        / "resources"
+        / "data"
+        / "world_map.gpkg"
+    ).as_posix() + "|layername=countries"
@@ -0,0 +1,104 @@
+# coding: utf8
+
+__contact__ = "info@hytech-imaging.fr"
+__copyright__ = "Copyright (c) 2022 Hytech Imaging"
+
+import csv
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from qgis.core import NULL, QgsFields, QgsFeature, QgsGeometry, QgsVectorLayer
+
+from .logger import Logger
+
+# key of the geometry in rows, either a WKT string or a QgsGeometry
+GEOMETRY = "wkt"
+
+
+def _integer(value):
+    return NULL if value in (None, "", NULL) else int(value)
+
+
+def _real(value):
+    return NULL if value in (None, "", NULL) else float(value)
+
+
+def _identity(value):
+    return value
+
+
+CONVERTERS = {
+    "Integer": _integer,
+    "Integer64": _integer,
+    "Real": _real,
+}
+
+
+def converters(
+    fields: QgsFields, names: Iterable[str]
+) -> List[Tuple[str, int, Callable]]:
+    """
+    Returns (name, field index, converter) of the columns of a row which
+    exist in fields, resolved once from the schema.
+    """
+    columns = []
+    for name in names:
+        idx = fields.indexOf(name)
+        if idx < 0 or name == "fid":
+            continue
+        converter = CONVERTERS.get(fields[idx].typeName(), _identity)
+        columns.append((name, idx, converter))
+    return columns
+
+
+def bulkLoad(layer: QgsVectorLayer, rows: List[Dict], name: str = "") -> int:
+    """
+    Adds rows (dictionaries of attributes, with an optional `GEOMETRY` key)
+    to a layer with a single addFeatures call committed at once. Returns the
+    number of features written.
+    """
+    start = time.perf_counter()
+    name = name or layer.name()
+    if not rows:
+        return 0
+
+    fields = layer.fields()
+    columns = converters(fields, rows[0].keys())
+    features = []
+    for row in rows:
+        feature = QgsFeature(fields)
+        attributes = feature.attributes()
+        for key, idx, converter in columns:
+            attributes[idx] = converter(row[key])
+        feature.setAttributes(attributes)
+
+        geometry = row.get(GEOMETRY)
+        if isinstance(geometry, str):
+            geometry = QgsGeometry.fromWkt(geometry)
+        if geometry:
+            feature.setGeometry(geometry)
+        features.append(feature)
+
+    if not layer.isEditable():
+        layer.startEditing()
+    layer.addFeatures(features)
+    if not layer.commitChanges():
+        Logger.error(
+            f"Unable to load {name}: " + ", ".join(layer.commitErrors())
+        )
+        layer.rollBack()
+        return 0
+
+    Logger.log(
+        f"{name}: {len(features)} rows loaded in "
+        f"{(time.perf_counter() - start) * 1000:.0f} ms"
+    )
+    return len(features)
+
+
+def readCsv(path: Path, delimiter: str = ",") -> List[Dict]:
+    if not path.exists():
+        return []
+    with open(path.as_posix()) as f:
+        return list(csv.DictReader(f, delimiter=delimiter))
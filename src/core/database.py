@@ -3,28 +3,36 @@
 __contact__ = "info@hytech-imaging.fr"
 __copyright__ = "Copyright (c) 2022 Hytech Imaging"
 
-import csv
+import shutil
+import hashlib
 import os.path
+import tempfile
+import threading
 from pathlib import Path
 
+from typing import Dict, List, Tuple
+
+from osgeo import gdal
+from qgis.PyQt import sip
 from qgis.PyQt.QtCore import QVariant
 from qgis.core import (
     QgsField,
+    QgsSettings,
     QgsFields,
     QgsFeature,
     QgsProject,
     QgsWkbTypes,
-    QgsGeometry,
     QgsApplication,
     QgsFeatureSink,
     QgsVectorLayer,
-    QgsFeatureRequest,
     QgsVectorFileWriter,
     QgsCoordinateReferenceSystem,
     QgsCoordinateTransformContext,
 )
 
+from .tail import layerTail
 from .status import StatusCode
+from .bulk import bulkLoad, readCsv
 
 DB_NAME = "sammo-boat.gpkg"
 
@@ -42,10 +50,59 @@ SURVEY_TYPE_TABLE = "survey_type"
 TRANSECT_TABLE = "transect"
 PLATEFORM_TABLE = "plateform"
 
+# version of the schema of the session database: to be increased when the
+# tables change, so that cached templates are rebuilt
+SCHEMA_VERSION = 2
+
+# value of OGR_SQLITE_PRAGMA before a durability profile was applied,
+# restored when the last open database is closed since the option applies to
+# the whole process
+_UNSET = object()
+_PREVIOUS_PRAGMA = _UNSET
+_DURABLE_DATABASES = 0
+_DURABILITY_LOCK = threading.Lock()
+
+# columns used to filter or order the dynamic tables
+INDEXES = {
+    ENVIRONMENT_TABLE: ["dateTime", "_effortGroup", "status"],
+    SIGHTINGS_TABLE: ["dateTime", "_effortGroup"],
+    FOLLOWERS_TABLE: ["dateTime", "_effortGroup", "_focalId"],
+    GPS_TABLE: ["dateTime"],
+}
+
+# typical queries of the plugin, to check that indexes are used
+DIAGNOSTIC_QUERIES = [
+    f"SELECT * FROM {ENVIRONMENT_TABLE} WHERE _effortGroup = 1",
+    f"SELECT * FROM {ENVIRONMENT_TABLE} "
+    f"WHERE status = '{StatusCode.display(StatusCode.BEGIN)}'",
+    f"SELECT * FROM {ENVIRONMENT_TABLE} WHERE dateTime < '2000-01-01' "
+    "ORDER BY dateTime DESC LIMIT 1",
+    f"SELECT * FROM {SIGHTINGS_TABLE} WHERE _effortGroup = 1",
+    f"SELECT * FROM {FOLLOWERS_TABLE} WHERE _focalId = 1",
+    f"SELECT * FROM {FOLLOWERS_TABLE} WHERE dateTime = '2000-01-01'",
+    f"SELECT * FROM {GPS_TABLE} WHERE dateTime <= '2000-01-01' "
+    "ORDER BY dateTime DESC LIMIT 1",
+]
+
+# SQLite pragmas applied to every connection opened on the geopackage. WAL
+# is persistent in the file, synchronous and cache_size are per connection.
+SAFE = "safe"
+FAST = "fast"
+DURABILITY_PROFILES = {
+    SAFE: "journal_mode=WAL,synchronous=FULL",
+    FAST: "journal_mode=WAL,synchronous=NORMAL,cache_size=-65536",
+}
+
 
 class SammoDataBase:
     def __init__(self):
         self.directory: str = ""
+        self.durability: str = ""
+        self._durable = False
+
+        # layers opened outside of the project, kept until the session is
+        # closed
+        self._layers: Dict[Tuple[str, str], QgsVectorLayer] = {}
 
     @property
     def path(self) -> str:
@@ -58,15 +115,95 @@ class SammoDataBase:
     def tableUri(self, table: str) -> str:
         return f"{self.path}|layername={table}"
 
+    def layer(self, uri: str, name: str) -> QgsVectorLayer:
+        """
+        Returns the layer of a table opened outside of the project, opened
+        once for the session
+        """
+        layer = self._layers.get((uri, name))
+        if layer is None or sip.isdeleted(layer):
+            layer = QgsVectorLayer(uri, baseName=name)
+            self._layers[(uri, name)] = layer
+        return layer
+
+    def takeLayer(self, uri: str, name: str) -> None:
+        self._layers.pop((uri, name), None)
+
+    def releaseLayers(self) -> None:
+        """
+        Closes the layers opened outside of the project, and so their
+        connections to the database
+        """
+        self._layers.clear()
+
     def writeProject(self, project: QgsProject) -> None:
         project.write(self.projectUri)
 
     def init(self, directory: str) -> bool:
         self.directory = directory
+        self.applyDurability(
+            QgsSettings().value("Sammo/SammoDataBase/Durability", SAFE)
+        )
 
         if SammoDataBase.exist(directory):
+            # sessions created by older versions get their indexes here
+            self.createIndexes()
             return False
 
+        # new sessions are a copy of a template built once per revision of
+        # the schema and of the data folder
+        shutil.copyfile(self.template(), self.path)
+        return True
+
+    def template(self) -> Path:
+        """
+        Returns the path of the cached template database, built if needed
+        """
+        folder = (
+            Path(QgsApplication.qgisSettingsDirPath())
+            / "sammo-boat"
+            / "templates"
+        )
+        path = folder / f"{self._templateKey()}.gpkg"
+        if path.exists():
+            return path
+
+        folder.mkdir(parents=True, exist_ok=True)
+        build = tempfile.mkdtemp(dir=folder)
+        try:
+            db = SammoDataBase()
+            db.directory = build
+            db._createDatabase()
+
+            # VACUUM INTO writes a self-contained copy, even if a part of
+            # the content is still in the WAL file of the build database
+            tmp = path.with_suffix(".tmp")
+            ds = gdal.OpenEx(db.path, gdal.OF_VECTOR)
+            ds.ExecuteSQL(f"VACUUM INTO '{tmp.as_posix()}'")
+            ds = None
+            if not tmp.exists():  # SQLite < 3.27
+                shutil.copyfile(db.path, tmp)
+            os.replace(tmp, path)
+        finally:
+            shutil.rmtree(build, ignore_errors=True)
+
+        # previous templates are useless now
+        for old in folder.glob("*.gpkg"):
+            if old != path:
+                old.unlink()
+        return path
+
+    @staticmethod
+    def _templateKey() -> str:
+        key = hashlib.sha1()
+        key.update(f"{SCHEMA_VERSION}|{QgsApplication.version()}".encode())
+        data = Path(__file__).parent.parent.parent / "data"
+        for csvFile in sorted(data.glob("*.csv")):
+            key.update(csvFile.name.encode())
+            key.update(csvFile.read_bytes())
+        return key.hexdigest()[:16]
+
+    def _createDatabase(self) -> None:
         self._createTable(
             self._createFieldsForEnvironmentTable(),
             ENVIRONMENT_TABLE,
@@ -107,9 +244,94 @@ class SammoDataBase:
         self._createTable(self._fieldsPlateform(), PLATEFORM_TABLE)
         self._populatePlateformTable()
 
-        self._copyWorldTable()
+        self.createIndexes()
 
-        return True
+    def applyDurability(self, profile: str) -> None:
+        """
+        Durability profile of the connections opened from now on, through
+        the OGR_SQLITE_PRAGMA configuration of GDAL. The configuration is
+        global, so it is kept as long as a database is open (including the
+        provider reopening it on edition) and restored by
+        `restoreDurability` when the last one is closed.
+        """
+        global _PREVIOUS_PRAGMA, _DURABLE_DATABASES
+
+        if profile not in DURABILITY_PROFILES:
+            profile = SAFE
+        with _DURABILITY_LOCK:
+            if not self._durable:
+                if _DURABLE_DATABASES == 0:
+                    _PREVIOUS_PRAGMA = gdal.GetConfigOption(
+                        "OGR_SQLITE_PRAGMA"
+                    )
+                _DURABLE_DATABASES += 1
+                self._durable = True
+            gdal.SetConfigOption(
+                "OGR_SQLITE_PRAGMA", DURABILITY_PROFILES[profile]
+            )
+        self.durability = profile
+
+    def restoreDurability(self) -> None:
+        """
+        Releases the durability profile of the database. The previous
+        OGR_SQLITE_PRAGMA configuration of GDAL is restored once no database
+        is open anymore, so that other databases opened by QGIS are not
+        affected by the profile.
+        """
+        global _PREVIOUS_PRAGMA, _DURABLE_DATABASES
+
+        with _DURABILITY_LOCK:
+            if not self._durable:
+                return
+            self._durable = False
+            self.durability = ""
+            _DURABLE_DATABASES -= 1
+            if _DURABLE_DATABASES > 0 or _PREVIOUS_PRAGMA is _UNSET:
+                return
+            gdal.SetConfigOption("OGR_SQLITE_PRAGMA", _PREVIOUS_PRAGMA)
+            _PREVIOUS_PRAGMA = _UNSET
+
+    def createIndexes(self) -> None:
+        """
+        Create the missing attribute indexes of the dynamic tables
+        """
+        ds = gdal.OpenEx(self.path, gdal.OF_VECTOR | gdal.OF_UPDATE)
+        if not ds:
+            return
+
+        for table, columns in INDEXES.items():
+            layer = ds.GetLayerByName(table)
+            if not layer:
+                continue
+            defn = layer.GetLayerDefn()
+            for column in columns:
+                if defn.GetFieldIndex(column) < 0:
+                    continue
+                ds.ExecuteSQL(
+                    f'CREATE INDEX IF NOT EXISTS "idx_{table}_{column}" '
+                    f'ON "{table}" ("{column}")'
+                )
+        ds = None
+
+    def queryPlans(self) -> Dict[str, List[str]]:
+        """
+        Returns the SQLite query plan of the typical queries of the plugin
+        """
+        plans = {}
+        ds = gdal.OpenEx(self.path, gdal.OF_VECTOR)
+        if not ds:
+            return plans
+
+        for query in DIAGNOSTIC_QUERIES:
+            result = ds.ExecuteSQL(f"EXPLAIN QUERY PLAN {query}")
+            plans[query] = []
+            if not result:
+                continue
+            for feature in result:
+                plans[query].append(feature.GetField("detail"))
+            ds.ReleaseResultSet(result)
+        ds = None
+        return plans
 
     @staticmethod
     def exist(directory: str) -> bool:
@@ -119,22 +341,10 @@ class SammoDataBase:
     def lastFeature(
         layer: QgsVectorLayer, mergeAction: bool = False
     ) -> QgsFeature:
-        feat = None
-        for feature in layer.getFeatures(
-            QgsFeatureRequest().addOrderBy("fid", False)
-        ):
-            if (
-                layer.name().casefold() == ENVIRONMENT_TABLE
-                and feature["status"] == StatusCode.display(StatusCode.END)
-                and not mergeAction
-            ):
-                continue
-            if not feat:
-                feat = feature
-            elif feature.id() > feat.id():
-                feat = feature
-
-        return feat
+        skipEnd = (
+            layer.name().casefold() == ENVIRONMENT_TABLE and not mergeAction
+        )
+        return layerTail(layer, skipEnd).last()
 
     def _createFieldsForEnvironmentTable(self) -> QgsFields:
         fields = QgsFields()
@@ -287,28 +497,7 @@ class SammoDataBase:
     ) -> None:
         lyr = QgsVectorLayer(self.tableUri(layer_id), "no_matter", "ogr")
         file = Path(__file__).parent.parent.parent / "data" / csv_name
-        lines = []
-        if file.exists():
-            with open(file.as_posix()) as f:
-                lines = [
-                    {k: v for k, v in row.items()}
-                    for row in csv.DictReader(f, delimiter=delimiter)
-                ]
-        lyr.startEditing()
-        for attr in lines:
-            ft = QgsFeature(lyr.fields())
-            for k, v in attr.items():
-                if k == "wkt":
-                    geom = QgsGeometry.fromWkt(v)
-                    ft.setGeometry(geom)
-                elif lyr.fields()[k].typeName() == "Integer":
-                    ft[k] = int(v)
-                elif lyr.fields()[k].typeName() == "Real":
-                    ft[k] = float(v)
-                else:
-                    ft[k] = v
-            lyr.addFeature(ft)
-        lyr.commitChanges()
+        bulkLoad(lyr, readCsv(file, delimiter), layer_id)
 
     def _fieldsSurveyType(self) -> QgsFields:
         fields = QgsFields()
@@ -318,19 +507,7 @@ class SammoDataBase:
     def _populateBoatTable(self) -> None:
         boatLyr = QgsVectorLayer(self.tableUri(BOAT_TABLE), "boat", "ogr")
         file = Path(__file__).parent.parent.parent / "data" / "boat.csv"
-        boats = []
-        if file.exists():
-            with open(file.as_posix()) as f:
-                boats = [
-                    {k: v for k, v in row.items()} for row in csv.DictReader(f)
-                ]
-        boatLyr.startEditing()
-        for boatAttr in boats:
-            ft = QgsFeature(boatLyr.fields())
-            for k, v in boatAttr.items():
-                ft[k] = v
-            boatLyr.addFeature(ft)
-        boatLyr.commitChanges()
+        bulkLoad(boatLyr, readCsv(file), BOAT_TABLE)
 
     def _fieldsSurvey(self) -> QgsFields:
         fields = QgsFields()
@@ -365,23 +542,7 @@ class SammoDataBase:
             self.tableUri(PLATEFORM_TABLE), "plateform", "ogr"
         )
         file = Path(__file__).parent.parent.parent / "data" / "plateform.csv"
-        plateforms = []
-        if file.exists():
-            with open(file.as_posix()) as f:
-                plateforms = [
-                    {
-                        k: (float(v) if k == "plateformHeight" else v)
-                        for k, v in row.items()
-                    }
-                    for row in csv.DictReader(f)
-                ]
-        plateformLyr.startEditing()
-        for plateformAttr in plateforms:
-            ft = QgsFeature(plateformLyr.fields())
-            for k, v in plateformAttr.items():
-                ft[k] = v
-            plateformLyr.addFeature(ft)
-        plateformLyr.commitChanges()
+        bulkLoad(plateformLyr, readCsv(file), PLATEFORM_TABLE)
 
     def _createTable(
         self, fields: QgsFields, tableName: str, geom=QgsWkbTypes.NoGeometry
@@ -419,25 +580,3 @@ class SammoDataBase:
     @staticmethod
     def _createFieldShortText(fieldName, len=50) -> QgsField:
         return QgsField(fieldName, QVariant.String, len=len)
-
-    def _copyWorldTable(self) -> None:
-        """
-        Copy world table from qgis data into gpkg file
-        """
-        opts = QgsVectorFileWriter.SaveVectorOptions()
-        opts.driverName = "GPKG"
-        opts.layerName = WORLD_TABLE
-        opts.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
-        layer = QgsVectorLayer(self._worldMapPath(), "World")
-        QgsVectorFileWriter.writeAsVectorFormatV2(
-            layer, self.path, QgsCoordinateTransformContext(), opts
-        )
-
-    @staticmethod
-    def _worldMapPath() -> str:
-        return (
-            Path(QgsApplication.instance().pkgDataPath())
-            / "resources"
-            / "data"
-            / "world_map.gpkg"
-        ).as_posix() + "|layername=countries"
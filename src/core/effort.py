@@ -0,0 +1,187 @@
+# coding: utf8
+
+__contact__ = "info@hytech-imaging.fr"
+__copyright__ = "Copyright (c) 2022 Hytech Imaging"
+
+from bisect import insort, bisect_left
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from qgis.PyQt.QtCore import QDateTime
+from qgis.core import QgsFeature, QgsVectorLayer, QgsFeatureRequest
+
+# attributes of the environment records followed by the tracker
+ATTRIBUTES = ["dateTime", "_effortGroup", "_effortLeg", "routeType", "status"]
+
+
+def _datetime(value) -> datetime:
+    if isinstance(value, QDateTime):
+        return value.toPyDateTime()
+    elif isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.min
+
+
+def _int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class SammoEffortRecord:
+    __slots__ = (
+        "fid",
+        "dateTime",
+        "effortGroup",
+        "effortLeg",
+        "routeType",
+        "status",
+    )
+
+    def __init__(self, fid: int, feature: QgsFeature):
+        self.fid = fid
+        self.dateTime = _datetime(feature["dateTime"])
+        self.effortGroup = _int(feature["_effortGroup"])
+        self.effortLeg = _int(feature["_effortLeg"])
+        self.routeType = feature["routeType"]
+        self.status = feature["status"]
+
+
+class SammoEffortTracker:
+    """
+    Effort state of the environment layer kept in memory: effort groups and
+    legs in use, and records sorted by datetime. It's updated from the edit
+    signals of the layer (additions, deletions, attribute changes, commits,
+    undo/redo and rollbacks), so that the state is read in constant time.
+    """
+
+    def __init__(self, layer: QgsVectorLayer):
+        self.layer = layer
+        self._records: Dict[int, SammoEffortRecord] = {}
+        self._sorted: List[Tuple[datetime, int]] = []
+        self._legs: Dict[int, Counter] = {}
+        self._maxGroup: Optional[int] = None
+        self._maxLegs: Dict[int, int] = {}
+        self._indexes = {
+            layer.fields().indexOf(name): name for name in ATTRIBUTES
+        }
+
+        layer.featureAdded.connect(self._onFeatureAdded)
+        layer.featuresDeleted.connect(self._onFeaturesDeleted)
+        layer.attributeValueChanged.connect(self._onAttributeValueChanged)
+        layer.committedFeaturesAdded.connect(self._onCommittedFeaturesAdded)
+        layer.afterRollBack.connect(self.reload)
+        self.reload()
+
+    def reload(self) -> None:
+        self._records = {}
+        self._sorted = []
+        self._legs = {}
+        self._maxGroup = None
+        self._maxLegs = {}
+
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(ATTRIBUTES, self.layer.fields())
+        for feature in self.layer.getFeatures(request):
+            self._add(SammoEffortRecord(feature.id(), feature))
+
+    @property
+    def maxGroup(self) -> int:
+        """
+        Greatest effort group in use, 0 if there's no record
+        """
+        if self._maxGroup is None:
+            self._maxGroup = max(self._legs, default=0)
+        return self._maxGroup
+
+    def maxLeg(self, effortGroup: int) -> int:
+        """
+        Greatest leg of an effort group, 0 if the group is not used
+        """
+        if effortGroup not in self._maxLegs:
+            self._maxLegs[effortGroup] = max(
+                self._legs.get(effortGroup, {}), default=0
+            )
+        return self._maxLegs[effortGroup]
+
+    def latest(self, exclude: int = None) -> Optional[SammoEffortRecord]:
+        """
+        Most recent record by datetime, other than `exclude`
+        """
+        for _, fid in reversed(self._sorted[-2:]):
+            if fid != exclude:
+                return self._records[fid]
+        return None
+
+    def _add(self, record: SammoEffortRecord) -> None:
+        self._records[record.fid] = record
+        insort(self._sorted, (record.dateTime, record.fid))
+        self._useLeg(record.effortGroup, record.effortLeg, 1)
+
+    def _remove(self, fid: int) -> Optional[SammoEffortRecord]:
+        record = self._records.pop(fid, None)
+        if record:
+            del self._sorted[bisect_left(self._sorted, (record.dateTime, fid))]
+            self._useLeg(record.effortGroup, record.effortLeg, -1)
+        return record
+
+    def _useLeg(self, effortGroup: int, effortLeg: int, count: int) -> None:
+        legs = self._legs.setdefault(effortGroup, Counter())
+        legs[effortLeg] += count
+
+        # cached maximums are computed again only when they may decrease
+        if count > 0:
+            if self._maxGroup is not None:
+                self._maxGroup = max(self._maxGroup, effortGroup)
+            if effortGroup in self._maxLegs:
+                self._maxLegs[effortGroup] = max(
+                    self._maxLegs[effortGroup], effortLeg
+                )
+        elif legs[effortLeg] <= 0:
+            del legs[effortLeg]
+            self._maxLegs.pop(effortGroup, None)
+            if not legs:
+                del self._legs[effortGroup]
+                if effortGroup == self._maxGroup:
+                    self._maxGroup = None
+
+    def _onFeatureAdded(self, fid: int) -> None:
+        self._remove(fid)
+        self._add(SammoEffortRecord(fid, self.layer.getFeature(fid)))
+
+    def _onFeaturesDeleted(self, fids: List[int]) -> None:
+        for fid in fids:
+            self._remove(fid)
+
+    def _onAttributeValueChanged(self, fid: int, idx: int, value) -> None:
+        if idx not in self._indexes or fid not in self._records:
+            return
+        record = self._remove(fid)
+        name = self._indexes[idx]
+        if name == "dateTime":
+            record.dateTime = _datetime(value)
+        elif name == "_effortGroup":
+            record.effortGroup = _int(value)
+        elif name == "_effortLeg":
+            record.effortLeg = _int(value)
+        elif name == "routeType":
+            record.routeType = value
+        elif name == "status":
+            record.status = value
+        self._add(record)
+
+    def _onCommittedFeaturesAdded(
+        self, layerId: str, features: List[QgsFeature]
+    ) -> None:
+        # temporary (negative) ids are replaced by the ids of the table
+        for fid in [fid for fid in self._records if fid < 0]:
+            self._remove(fid)
+        for feature in features:
+            self._remove(feature.id())
+            self._add(SammoEffortRecord(feature.id(), feature))
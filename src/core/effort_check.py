@@ -0,0 +1,289 @@
+# coding: utf8
+
+__contact__ = "info@hytech-imaging.fr"
+__copyright__ = "Copyright (c) 2022 Hytech Imaging"
+
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .status import StatusCode
+
+# kept apart from database.py to be usable without QGIS
+DB_NAME = "sammo-boat.gpkg"
+ENVIRONMENT_TABLE = "environment"
+OBSERVATION_TABLES = ["sightings", "followers"]
+
+ERROR = "error"
+WARNING = "warning"
+
+BEGIN = StatusCode.display(StatusCode.BEGIN)
+END = StatusCode.display(StatusCode.END)
+
+# (fid, dateTime, _effortGroup, _effortLeg, status) ordered by dateTime
+EnvironmentRow = Tuple[int, object, Optional[int], Optional[int], str]
+
+# (fid, dateTime, _effortGroup)
+ObservationRow = Tuple[int, object, Optional[int]]
+
+
+class SammoEffortIssue:
+    __slots__ = ("severity", "table", "fid", "effortGroup", "message")
+
+    def __init__(
+        self,
+        severity: str,
+        table: str,
+        fid: int,
+        effortGroup: Optional[int],
+        message: str,
+    ):
+        self.severity = severity
+        self.table = table
+        self.fid = fid
+        self.effortGroup = effortGroup
+        self.message = message
+
+    def __str__(self) -> str:
+        return self.message
+
+
+class SammoEffortReport:
+    """
+    Result of an effort check: issues found, and the number of records
+    and effort groups checked.
+    """
+
+    def __init__(self):
+        self.issues: List[SammoEffortIssue] = []
+        self.records = 0
+        self.groups = 0
+        self.observations = 0
+        self.duration = 0.0
+
+    @property
+    def errors(self) -> List[SammoEffortIssue]:
+        return [i for i in self.issues if i.severity == ERROR]
+
+    @property
+    def warnings(self) -> List[SammoEffortIssue]:
+        return [i for i in self.issues if i.severity == WARNING]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def add(
+        self,
+        severity: str,
+        table: str,
+        fid: int,
+        effortGroup: Optional[int],
+        message: str,
+    ) -> None:
+        self.issues.append(
+            SammoEffortIssue(severity, table, fid, effortGroup, message)
+        )
+
+    def summary(self) -> str:
+        return (
+            f"{self.records} environment records, {self.groups} effort "
+            f"groups, {self.observations} observations: "
+            f"{len(self.errors)} errors, {len(self.warnings)} warnings "
+            f"({self.duration * 1000:.0f} ms)"
+        )
+
+    def text(self) -> str:
+        return "\n".join(
+            [str(i) for i in self.errors + self.warnings] + [self.summary()]
+        )
+
+
+class _Group:
+    __slots__ = ("start", "end", "leg")
+
+    def __init__(self, start):
+        self.start = start
+        self.end = None
+        self.leg = None
+
+
+def checkEffort(
+    environment: Iterable[EnvironmentRow],
+    observations: Dict[str, Iterable[ObservationRow]] = None,
+) -> SammoEffortReport:
+    """
+    Checks the effort status of environment records in a single scan of
+    rows ordered by datetime: each effort group starts with a BEGIN
+    record, has no record after its END, and legs don't decrease. Several
+    BEGIN codes, overlapping groups (records inserted afterwards at past
+    times) and observations out of any known effort group (recorded before
+    the first environment record for example) are only warnings.
+    """
+    start = time.perf_counter()
+    report = SammoEffortReport()
+    groups: Dict[int, _Group] = {}
+    maxGroup = None
+    lastGroup = None
+
+    for fid, dt, effortGroup, effortLeg, status in environment:
+        report.records += 1
+        if dt is None:
+            report.add(
+                ERROR,
+                ENVIRONMENT_TABLE,
+                fid,
+                effortGroup,
+                f"Missing datetime for environment record {fid}",
+            )
+        if effortGroup is None:
+            report.add(
+                ERROR,
+                ENVIRONMENT_TABLE,
+                fid,
+                None,
+                f"Missing effortGroup for environment record {fid} ({dt})",
+            )
+            continue
+
+        group = groups.get(effortGroup)
+        if group is None:
+            group = groups[effortGroup] = _Group(dt)
+            if maxGroup is not None and effortGroup < maxGroup:
+                report.add(
+                    ERROR,
+                    ENVIRONMENT_TABLE,
+                    fid,
+                    effortGroup,
+                    f"EffortGroup {effortGroup} starts after effortGroup "
+                    f"{maxGroup} ({dt} record)",
+                )
+            if status != BEGIN:
+                report.add(
+                    ERROR,
+                    ENVIRONMENT_TABLE,
+                    fid,
+                    effortGroup,
+                    f"Missing BEGIN code for effortGroup {effortGroup} "
+                    f"(before {dt} record)",
+                )
+        else:
+            if effortGroup != lastGroup:
+                report.add(
+                    WARNING,
+                    ENVIRONMENT_TABLE,
+                    fid,
+                    effortGroup,
+                    f"EffortGroup {effortGroup} overlaps effortGroup "
+                    f"{lastGroup} ({dt} record)",
+                )
+            if group.end is not None:
+                report.add(
+                    ERROR,
+                    ENVIRONMENT_TABLE,
+                    fid,
+                    effortGroup,
+                    f"Record after the END code of effortGroup "
+                    f"{effortGroup} ({dt} record)",
+                )
+            if status == BEGIN:
+                report.add(
+                    WARNING,
+                    ENVIRONMENT_TABLE,
+                    fid,
+                    effortGroup,
+                    f"Several BEGIN codes for effortGroup {effortGroup} "
+                    f"({dt} record)",
+                )
+            if (
+                effortLeg is not None
+                and group.leg is not None
+                and effortLeg < group.leg
+            ):
+                report.add(
+                    ERROR,
+                    ENVIRONMENT_TABLE,
+                    fid,
+                    effortGroup,
+                    f"EffortLeg {effortLeg} after effortLeg {group.leg} in "
+                    f"effortGroup {effortGroup} ({dt} record)",
+                )
+
+        if status == END:
+            group.end = dt
+        if effortLeg is not None and (
+            group.leg is None or effortLeg > group.leg
+        ):
+            group.leg = effortLeg
+        if maxGroup is None or effortGroup > maxGroup:
+            maxGroup = effortGroup
+        lastGroup = effortGroup
+
+    report.groups = len(groups)
+
+    for table, rows in (observations or {}).items():
+        for fid, dt, effortGroup in rows:
+            report.observations += 1
+            group = groups.get(effortGroup)
+            if effortGroup is None or group is None:
+                report.add(
+                    WARNING,
+                    table,
+                    fid,
+                    effortGroup,
+                    f"Unknown effortGroup {effortGroup} for {table} record "
+                    f"{fid} ({dt})",
+                )
+            elif (
+                dt is not None and group.start is not None and dt < group.start
+            ):
+                report.add(
+                    WARNING,
+                    table,
+                    fid,
+                    effortGroup,
+                    f"{table.capitalize()} record {fid} ({dt}) before the "
+                    f"start of effortGroup {effortGroup}",
+                )
+
+    report.duration = time.perf_counter() - start
+    return report
+
+
+def checkDatabase(path: Path) -> SammoEffortReport:
+    """
+    Checks the effort of a session database (or session directory) with
+    sqlite only, without QGIS
+    """
+    path = Path(path)
+    if path.is_dir():
+        path = path / DB_NAME
+    if not path.exists():
+        raise FileNotFoundError(f"No session database: {path}")
+
+    connection = sqlite3.connect(f"file:{path.as_posix()}?mode=ro", uri=True)
+    try:
+        environment = connection.execute(
+            "SELECT fid, dateTime, _effortGroup, _effortLeg, status "
+            f"FROM {ENVIRONMENT_TABLE} ORDER BY dateTime, fid"
+        )
+        observations = {
+            table: connection.execute(
+                f"SELECT fid, dateTime, _effortGroup FROM {table}"
+            )
+            for table in OBSERVATION_TABLES
+        }
+        return checkEffort(environment, observations)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    # python -m src.core.effort_check <session> (from plugin folder)
+    if len(sys.argv) < 2:
+        sys.exit("usage: effort_check <session directory or database>")
+    report = checkDatabase(sys.argv[1])
+    print(report.text())
+    sys.exit(0 if report.ok else 1)
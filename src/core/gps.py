@@ -4,35 +4,54 @@ __contact__ = "info@hytech-imaging.fr"
 __copyright__ = "Copyright (c) 2022 Hytech Imaging"
 
 import os
-import sys
 import time
 import serial
 import platform
-from typing import Tuple, Optional
+import threading
+from typing import List, Optional
 from serial import SerialException
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from qgis.core import QgsSettings
 from qgis.PyQt.QtCore import pyqtSignal
 
+from . import nmea
+from .logger import Logger
+from .nmea_journal import SammoNmeaJournal, records, replay, parseSpeed
 from .other_thread import WorkerForOtherThread, OtherThread
 
 BAUDRATES = [4800, 9600, 115200, 19200]
 
+# maximum duration in seconds to wait for a position sentence on a port
+PROBE_DURATION = 1.5
+
+# fixes replayed from a journal are sent at least every `REPLAY_BATCH`
+# seconds
+REPLAY_BATCH = 0.1
+
 
 class WorkerGpsExtractor(WorkerForOtherThread):
-    addNewFeatureToGpsTableSignal = pyqtSignal(
-        float, float, int, int, int, float, float
-    )
+    # list of complete SammoFix, one per epoch
+    addNewFeaturesToGpsTableSignal = pyqtSignal(list)
 
     def __init__(self):
         super().__init__()
         self._gps: Optional[serial.Serial] = None
+        self._buffer = nmea.SammoNmeaBuffer()
+        self._fusion = nmea.SammoFixFusion()
+        self._journal: Optional[SammoNmeaJournal] = None
         self.isGpsOnline: bool = False
         self.isGPRMCMode: bool = False
         self.idOfPort: int = 0
         self.timeOfLastContact = None
 
     def _onStart(self):
-        pass
+        self._journal = SammoNmeaJournal.fromSettings()
+
+    def run(self):
+        super().run()
+        if self._journal:
+            self._journal.close()
 
     @staticmethod
     def _serialPortPrefix() -> str:
@@ -51,10 +70,11 @@ class WorkerGpsExtractor(WorkerForOtherThread):
                     print("autodetect failed")
                 return
 
-        # read frame from serial port
+        # read all available bytes from serial port, waiting at most for
+        # the timeout of the port if nothing is available yet
         try:
-            line = self._gps.readline()
-            line = line.decode("cp1250")
+            data = self._gps.read(self._gps.in_waiting or 1)
+            data += self._gps.read(self._gps.in_waiting)
         except Exception:
             if self._gps:
                 self._gps.close()
@@ -64,87 +84,101 @@ class WorkerGpsExtractor(WorkerForOtherThread):
             self.isGpsOnline = False
             return
 
-        # check frame type
-        try:
-            if self.isGprmcLine(line):
-                frame = SammoGprmcFrame(line)
-            elif self.isGpggaLine(line):
-                frame = SammoGpggaFrame(line)
-            else:
-                self.toDoIfNotAGpggaLine()
-                return
-
-            position = frame.positionData
-            longitude_deg = position[0]
-            if longitude_deg != sys.float_info.max:
-                self.timeOfLastContact = time.time()
-                latitude_deg = position[1]
-                h, m, s = frame.dateTime
-                speed, course = frame.track
-                self.addNewFeatureToGpsTableSignal.emit(
-                    float(longitude_deg),
-                    float(latitude_deg),
-                    h,
-                    m,
-                    s,
-                    speed,
-                    course,
-                )
-                self.isGpsOnline = True
-            else:
-                if os.environ.get("SAMMO_DEBUG"):
-                    print("GPS offline - position not valid")
-                self.isGpsOnline = False
-        except Exception:
+        # check frames type and merge them into one fix per epoch
+        fixes = []
+        invalid = False
+        for line in self._buffer.feed(data):
+            if self._journal:
+                self._journal.write(line)
+            fix = nmea.parse(line)
+            if not fix:
+                continue
+            elif fix.sentence in (nmea.RMC, nmea.GGA) and not fix.valid:
+                invalid = True
+            fixes += self._fusion.add(fix)
+
+        if fixes:
+            # all fixes are sent to the main thread at once
+            self.timeOfLastContact = time.time()
+            self.addNewFeaturesToGpsTableSignal.emit(fixes)
+            self.isGpsOnline = True
+        elif invalid:
             if os.environ.get("SAMMO_DEBUG"):
-                print("GPS online but invalid frame (no signal?)")
+                print("GPS offline - position not valid")
             self.isGpsOnline = False
+        else:
+            self.toDoIfNotAGpggaLine()
 
     def autodetect(self):
-        for i in range(0, 9):
-            for baudrate in BAUDRATES:
-                port = "{}{}".format(self._serialPortPrefix(), str(i))
-                try:
-                    self._gps = serial.Serial(
-                        port, baudrate=baudrate, timeout=0.5
-                    )
-                    self._gps.flush()  # flush incomplete line
-                    time.sleep(1.0)
-                    self._gps.readline(self._gps.in_waiting)
-                    time.sleep(0.5)
-                    check = self._gps.readline(self._gps.in_waiting)
-                    assert check.decode("cp1250")[0] == "$"
-                    suitable = False
-                    nb = 0
-                    while not suitable:
-                        check = self._gps.readline().decode("cp1250")
-                        print(check)
-                        if self.isGprmcLine(check) or self.isGpggaLine(check):
-                            break
-                        nb += 1
-                        if nb >= 20:
-                            raise Exception(
-                                "GPS has no GPRMC, neither GPGGA frames"
-                            )
-                    print(f"Port GPS ouvert sur {port}, baudrate:{baudrate}")
-                except (
-                    SerialException,
-                    OSError,
-                    UnicodeDecodeError,
-                    AssertionError,
-                    Exception,
-                ) as e:
-                    if os.environ.get("SAMMO_DEBUG"):
-                        print(e)
-                    self.isGpsOnline = False
-                    if self._gps:
-                        self._gps.close()
-                    self._gps = None
+        self.isGpsOnline = False
+        self._buffer.clear()
+        self._fusion.clear()
+
+        # the last suitable port is tried first to reconnect quickly
+        settings = QgsSettings()
+        port = settings.value("Sammo/WorkerGpsExtractor/Port", "")
+        baudrate = int(settings.value("Sammo/WorkerGpsExtractor/Baudrate", 0))
+        if port and baudrate:
+            self._gps = self._probe(port, [baudrate], threading.Event())
+            if self._gps:
+                return
+
+        # probe all ports concurrently, baudrates of a port being tested
+        # one after another because a port can only be opened once
+        ports = [f"{self._serialPortPrefix()}{i}" for i in range(0, 9)]
+        found = threading.Event()
+        with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+            futures = [
+                executor.submit(self._probe, port, BAUDRATES, found)
+                for port in ports
+            ]
+            for future in as_completed(futures):
+                gps = future.result()
+                if not gps:
+                    continue
+                elif self._gps:
+                    gps.close()
                     continue
+                self._gps = gps
+                found.set()  # cancel other probes
 
-                # don't test other serial port if everyhing looks good
-                if self._gps:
-                    return
+        if self._gps:
+            settings.setValue("Sammo/WorkerGpsExtractor/Port", self._gps.port)
+            settings.setValue(
+                "Sammo/WorkerGpsExtractor/Baudrate", self._gps.baudrate
+            )
+
+    def _probe(
+        self, port: str, baudrates: List[int], cancel: threading.Event
+    ) -> Optional[serial.Serial]:
+        for baudrate in baudrates:
+            if cancel.is_set():
+                return None
+
+            gps = None
+            try:
+                gps = serial.Serial(port, baudrate=baudrate, timeout=0.5)
+                gps.reset_input_buffer()  # drop incomplete line
+                deadline = time.monotonic() + PROBE_DURATION
+                while time.monotonic() < deadline and not cancel.is_set():
+                    if self.isPositionLine(gps.readline()):
+                        Logger.log(
+                            f"GPS port opened on {port}, baudrate: {baudrate}"
+                        )
+                        return gps
+                gps.close()
+            except Exception as e:
+                # the port does not exist, is busy or is not a serial device:
+                # no need to try other baudrates, nor to stop the probes of
+                # other ports
+                if not isinstance(e, (SerialException, OSError)):
+                    Logger.warning(f"GPS probe failed on {port}: {e}")
+                elif os.environ.get("SAMMO_DEBUG"):
+                    Logger.log(f"GPS probe failed on {port}: {e}")
+                if gps:
+                    gps.close()
+                return None
+        return None
 
     def toDoIfNotAGpggaLine(self):
         if self.isGpsOnline and (time.time() - self.timeOfLastContact) > 5:
@@ -155,18 +189,17 @@ class WorkerGpsExtractor(WorkerForOtherThread):
                 print("GPS offline - time with no contact too long")
 
     @staticmethod
-    def isGpggaLine(line: str) -> bool:
-        typeOfLine = line[0:6]
-        return typeOfLine == "$GPGGA"
-
-    @staticmethod
-    def isGprmcLine(line: str) -> bool:
-        typeOfLine = line[0:6]
-        return typeOfLine == "$GPRMC"
+    def isPositionLine(line: bytes) -> bool:
+        fix = nmea.parse(line)
+        return bool(fix) and fix.sentence in (nmea.RMC, nmea.GGA)
 
 
 class SammoGpsReader(OtherThread):
-    frame = pyqtSignal(float, float, int, int, int, float, float)
+    # longitude, latitude, hour, minute, second, speed, course, millisecond,
+    # year, month, day (-1 when the date is unknown)
+    frame = pyqtSignal(
+        float, float, int, int, int, float, float, int, int, int, int
+    )
 
     def __init__(self):
         super().__init__()
@@ -175,9 +208,25 @@ class SammoGpsReader(OtherThread):
 
     def start(self) -> None:
         self.worker = WorkerGpsExtractor()
-        self.worker.addNewFeatureToGpsTableSignal.connect(self.newFrame)
+        self.worker.addNewFeaturesToGpsTableSignal.connect(self.newFrames)
         super()._start(self.worker)
 
+    def newFrames(self, fixes: List[nmea.SammoFix]) -> None:
+        for fix in fixes:
+            self.newFrame(
+                fix.longitude,
+                fix.latitude,
+                fix.hour,
+                fix.minute,
+                fix.second,
+                fix.speed,
+                fix.course,
+                fix.millisecond,
+                fix.year,
+                fix.month,
+                fix.day,
+            )
+
     def newFrame(
         self,
         longitude: float,
@@ -187,130 +236,134 @@ class SammoGpsReader(OtherThread):
         sec: int,
         speed: float = -9999.0,
         course: float = -9999.0,
+        msec: int = 0,
+        year: int = -1,
+        month: int = -1,
+        day: int = -1,
     ) -> None:
         if self.active:
             self.frame.emit(
-                longitude, latitude, hour, minute, sec, speed, course
+                longitude,
+                latitude,
+                hour,
+                minute,
+                sec,
+                speed,
+                course,
+                msec,
+                year,
+                month,
+                day,
             )
 
 
-class SammoFrame:
-    def __init__(self, line: str):
-        self.longitude: float = 0.0
-        self.latitude: float = 0.0
-        self.hour: int = 0
-        self.minute: int = 0
-        self.second: int = 0
-        self.speed: float = -9999.0
-        self.course: float = -9999.0
-        self.dateTime: Tuple[int, int, int] = line
-        self.positionData: Tuple[float, float] = line
-
-    @property
-    def dateTime(self) -> Tuple[int, int, int]:
-        return self.hour, self.minutes, self.secondes
-
-    @property
-    def positionData(self) -> Tuple[float, float]:
-        return self.longitude, self.latitude
-
-    @property
-    def track(self) -> Tuple[float, float]:
-        return self.speed, self.course
-
-
-class SammoGpggaFrame(SammoFrame):
-    def __init__(self, line: str):
-        super().__init__(line)
-
-    @property
-    def dateTime(self) -> Tuple[int, int, int]:
-        return super().dateTime
-
-    @dateTime.setter
-    def dateTime(self, line: str) -> None:
-        components = line.split(",")
-        time = components[1]
-        self.hour = int(time[0:2])
-        self.minutes = int(time[2:4])
-        self.secondes = int(float(time[4:]))
-
-    @property
-    def positionData(self) -> Tuple[float, float]:
-        return super().positionData
-
-    @positionData.setter
-    def positionData(self, line: str) -> None:
-        components = line.split(",")
-        time = components[1]
-        if not time:
-            return sys.float_info.max, sys.float_info.max
-
-        latitudeAsTxt = components[2]
-        latitude_deg = latitudeAsTxt[0:2]
-        latitude_min = latitudeAsTxt[2:]
-        self.latitude = float(latitude_deg) + float(latitude_min) / 60.0
-        if components[3] != "N":
-            self.latitude = -self.latitude
-        longitudeAsTxt = components[4]
-        longitude_deg = longitudeAsTxt[0:3]
-        longitude_min = longitudeAsTxt[3:]
-        self.longitude = float(longitude_deg) + float(longitude_min) / 60.0
-        if components[5] != "E":
-            self.longitude = -self.longitude
-
-    @property
-    def track(self) -> Tuple[float, float]:
-        return super().track
-
-
-class SammoGprmcFrame(SammoFrame):
-    def __init__(self, line: str):
-        super().__init__(line)
-        self.track: Tuple[float, float] = line
-
-    @property
-    def dateTime(self) -> Tuple[int, int, int]:
-        return super().dateTime
-
-    @dateTime.setter
-    def dateTime(self, line: str) -> None:
-        components = line.split(",")
-        time = components[1]
-        self.hour = int(time[0:2])
-        self.minutes = int(time[2:4])
-        self.secondes = int(float(time[4:]))
-
-    @property
-    def positionData(self) -> Tuple[float, float]:
-        return super().positionData
-
-    @positionData.setter
-    def positionData(self, line: str) -> None:
-        components = line.split(",")
-        time = components[1]
-        if not time:
-            return sys.float_info.max, sys.float_info.max
-
-        latitudeAsTxt = components[3]
-        latitude_deg = latitudeAsTxt[0:2]
-        latitude_min = latitudeAsTxt[2:]
-        self.latitude = float(latitude_deg) + float(latitude_min) / 60.0
-        if components[4] != "N":
-            self.latitude = -self.latitude
-        longitudeAsTxt = components[5]
-        longitude_deg = longitudeAsTxt[0:3]
-        longitude_min = longitudeAsTxt[3:]
-        self.longitude = float(longitude_deg) + float(longitude_min) / 60.0
-        if components[6] != "E":
-            self.longitude = -self.longitude
-
-    @property
-    def track(self) -> Tuple[float, float]:
-        return super().track
-
-    @track.setter
-    def track(self, line) -> None:
-        components = line.split(",")
-        self.speed = float(components[7])
-        self.course = float(components[8])
+class WorkerNmeaReplay(WorkerForOtherThread):
+    # list of complete SammoFix, one per epoch
+    addNewFeaturesToGpsTableSignal = pyqtSignal(list)
+
+    def __init__(self, path: str, speed: float = 1.0):
+        super().__init__()
+        self._path = path
+        self._speed = speed
+        self._lines = None
+        self._fixes = []
+        self._paused = 0.0
+        self._buffer = nmea.SammoNmeaBuffer()
+        self._fusion = nmea.SammoFixFusion()
+        # same attribute as the serial worker, to know if a source is ready
+        self._gps = None
+        # the replay only runs when someone is listening
+        self.playing = False
+
+    def _onStart(self):
+        self._lines = replay(
+            records(self._path), self._speed, self._sleep, self._clock
+        )
+        self._gps = self._path
+
+    def _toDoInsideLoop(self):
+        # the worker idles at the end of the journal until it's stopped
+        if not self.playing or self._lines is None:
+            self._pause(REPLAY_BATCH)
+            return
+
+        deadline = time.monotonic() + REPLAY_BATCH
+        while (
+            time.monotonic() < deadline
+            and self.playing
+            and not self._isNeedToStop
+        ):
+            line = next(self._lines, None)
+            if line is None:
+                self._log(f"end of NMEA replay {self._path}")
+                self._lines = None
+                break
+
+            # lines go through the same path as bytes read from a port
+            for sentence in self._buffer.feed(line + b"\n"):
+                fix = nmea.parse(sentence)
+                if fix:
+                    self._fixes += self._fusion.add(fix)
+        self._emit()
+
+    def _emit(self) -> None:
+        if self._fixes:
+            self.addNewFeaturesToGpsTableSignal.emit(self._fixes)
+            self._fixes = []
+
+    def _clock(self) -> float:
+        # time spent paused doesn't count in the pacing of the replay
+        return time.monotonic() - self._paused
+
+    def _pause(self, duration: float) -> None:
+        start = time.monotonic()
+        time.sleep(duration)
+        self._paused += time.monotonic() - start
+
+    def _sleep(self, delay: float) -> None:
+        # fixes already read are sent before waiting for the next line
+        self._emit()
+        end = self._clock() + delay
+        while not self._isNeedToStop and self._clock() < end:
+            if self.playing:
+                time.sleep(max(0.0, min(REPLAY_BATCH, end - self._clock())))
+            else:
+                self._pause(REPLAY_BATCH)
+
+
+class SammoNmeaReplay(SammoGpsReader):
+    """
+    GPS reader fed by a raw NMEA journal instead of a serial port, at
+    1x, 10x, 100x... or maximum speed. The replay is paused while the
+    frames are not connected.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+
+    def start(self) -> None:
+        self.worker = WorkerNmeaReplay(self.path, self.speed)
+        self.worker.addNewFeaturesToGpsTableSignal.connect(self.newFrames)
+        super()._start(self.worker)
+
+    def connectNotify(self, signal) -> None:
+        super().connectNotify(signal)
+        if self.worker:
+            self.worker.playing = bool(self.receivers(self.frame))
+
+    def disconnectNotify(self, signal) -> None:
+        super().disconnectNotify(signal)
+        if self.worker:
+            self.worker.playing = bool(self.receivers(self.frame))
+
+    @staticmethod
+    def fromEnvironment() -> Optional["SammoNmeaReplay"]:
+        # SAMMO_NMEA_REPLAY=<journal file or directory>
+        # SAMMO_NMEA_REPLAY_SPEED=1|10|100|max
+        path = os.environ.get("SAMMO_NMEA_REPLAY")
+        if not path:
+            return None
+        speed = os.environ.get("SAMMO_NMEA_REPLAY_SPEED", "1")
+        return SammoNmeaReplay(path, parseSpeed(speed))
@@ -0,0 +1,113 @@
+# coding: utf8
+
+__contact__ = "info@hytech-imaging.fr"
+__copyright__ = "Copyright (c) 2022 Hytech Imaging"
+
+from typing import Dict, List, Set
+
+from qgis.PyQt.QtCore import QTimer
+from qgis.core import QgsSettings, QgsVectorLayer
+
+from .logger import Logger
+
+# default time window in milliseconds during which changes are gathered
+# before being committed, 0 to commit at once
+COMMIT_WINDOW = 1000
+
+
+class SammoGroupCommit:
+    """
+    Commits the edits of several layers in groups.
+
+    Features changed in each layer since the last commit (added, deleted,
+    or with changed attributes or geometry) are counted from the edit
+    signals, so that knowing whether a layer is dirty doesn't require to go
+    through its edit buffer. A scheduled commit is delayed by the commit
+    window, so that a burst of changes (a group of sightings for example)
+    ends up in a single transaction per layer. Only dirty layers are
+    committed, and `flush` commits them at once.
+    """
+
+    def __init__(self, layers: List[QgsVectorLayer]):
+        self.layers: Dict[str, QgsVectorLayer] = {}
+        self.window = int(
+            QgsSettings().value("Sammo/SammoGroupCommit/Window", COMMIT_WINDOW)
+        )
+        self._pending: Dict[str, Set[int]] = {}
+
+        self._timer = QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+        for layer in layers:
+            self._watch(layer)
+
+    def isDirty(self, layer: QgsVectorLayer = None) -> bool:
+        if layer is None:
+            return any(self._pending.values())
+        return bool(self._pending.get(layer.id()))
+
+    def pendingChanges(self) -> Dict[str, int]:
+        """
+        Number of features changed since the last commit, per layer name
+        """
+        return {
+            layer.name(): len(self._pending[layerId])
+            for layerId, layer in self.layers.items()
+        }
+
+    def schedule(self) -> None:
+        """
+        Commits dirty layers at the end of the commit window. The window is
+        not extended by later changes, so that commits keep happening
+        during a long burst.
+        """
+        if self.window <= 0:
+            self.flush()
+        elif not self._timer.isActive():
+            self._timer.start(self.window)
+
+    def flush(self) -> None:
+        """
+        Commits dirty layers now
+        """
+        self._timer.stop()
+        for layerId, layer in self.layers.items():
+            if not self._pending[layerId]:
+                continue
+            if layer.commitChanges():
+                self._pending[layerId].clear()
+            else:
+                Logger.error(
+                    f"Unable to save {layer.name()}: "
+                    + ", ".join(layer.commitErrors())
+                )
+            layer.startEditing()
+
+    def _watch(self, layer: QgsVectorLayer) -> None:
+        layerId = layer.id()
+        self.layers[layerId] = layer
+        pending = self._pending[layerId] = set()
+
+        def changed(fid: int, *args) -> None:
+            pending.add(fid)
+
+        def deleted(fids: List[int]) -> None:
+            for fid in fids:
+                # a feature added then deleted before a commit is no change
+                if fid < 0:
+                    pending.discard(fid)
+                else:
+                    pending.add(fid)
+
+        def forget() -> None:
+            self.layers.pop(layerId, None)
+            self._pending.pop(layerId, None)
+
+        layer.featureAdded.connect(changed)
+        layer.featuresDeleted.connect(deleted)
+        layer.attributeValueChanged.connect(changed)
+        layer.geometryChanged.connect(changed)
+        layer.afterRollBack.connect(pending.clear)
+        layer.afterCommitChanges.connect(pending.clear)
+        layer.willBeDeleted.connect(forget)
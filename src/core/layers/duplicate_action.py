@@ -17,22 +17,19 @@ from qgis.PyQt.QtWidgets import (
 from qgis.core import (
     QgsProject,
     QgsFeature,
+    QgsPointXY,
     QgsGeometry,
     QgsVectorLayer,
-    QgsGeometryUtils,
-    QgsFeatureRequest,
     QgsVectorLayerUtils,
 )
 
 
 class DuplicateDialog(QDialog):
-    def __init__(
-        self, toDuplicate: int, layerId: str, gpsLayer: QgsVectorLayer
-    ):
+    def __init__(self, toDuplicate: int, layerId: str):
         super().__init__()
         self.layer: QgsVectorLayer = QgsProject.instance().mapLayer(layerId)
         self.setWindowTitle(f"Duplicate {self.layer.name().lower()} entity")
-        self.gpsLayer: QgsVectorLayer = gpsLayer
+        self.positions = self.sessionPositions()
         self.toDuplicate: QgsFeature = self.layer.getFeature(toDuplicate)
         self.validateButton = QPushButton("Duplicate with changes")
         self.validateButton.clicked.connect(self.validate)
@@ -143,72 +140,28 @@ class DuplicateDialog(QDialog):
             if pluginInstance.__class__.__name__ == "Sammo":
                 pluginInstance.filterTable()
 
+    @staticmethod
+    def sessionPositions():
+        # position index of the current session, shared with the plugin
+        for pluginInstance in utils.plugins.values():
+            if pluginInstance.__class__.__name__ == "Sammo":
+                return pluginInstance.session.positions
+        return None
+
     def updateGeometry(self):
         dt = self.datetimeEdit.dateTime()
-        request = QgsFeatureRequest().setFilterExpression(
-            f"datetime = to_datetime('{dt.toPyDateTime().isoformat()}')"
-        )
-        ftsExact = [ft for ft in self.gpsLayer.getFeatures(request)]
-        if ftsExact:
-            self.interpolated = ftsExact[0].geometry()
-            self.geometryLabel.setText(
-                f"Interpolated position : {self.interpolated.asWkt(3)}"
-            )
-            return
+        position = None
+        if self.positions is not None:
+            position = self.positions.position(dt.toPyDateTime().timestamp())
 
-        request = QgsFeatureRequest().setFilterExpression(
-            f"datetime <= to_datetime('{dt.toPyDateTime().isoformat()}')"
-        )
-        request = request.addOrderBy("dateTime", False)
-        ftsBefore = [ft for ft in self.gpsLayer.getFeatures(request)]
-        ftBefore = None
-        if ftsBefore:
-            ftBefore = ftsBefore[0]
-
-        request = QgsFeatureRequest().setFilterExpression(
-            f"datetime >= to_datetime('{dt.toPyDateTime().isoformat()}')"
-        )
-        request = request.addOrderBy("dateTime")
-        ftsAfter = [ft for ft in self.gpsLayer.getFeatures(request)]
-        ftAfter = None
-        if ftsAfter:
-            ftAfter = ftsAfter[0]
-
-        if not ftBefore or not ftAfter:
+        if position is None:
             self.geometryLabel.setText(
                 "Interpolated position : datetime out of bounds"
             )
             self.interpolated = QgsGeometry()
             return
-        duration = (
-            ftAfter["datetime"].toPyDateTime()
-            - ftBefore["datetime"].toPyDateTime()
-        ).total_seconds()
-        beforePercent = (
-            (
-                dt.toPyDateTime() - ftBefore["datetime"].toPyDateTime()
-            ).total_seconds()
-            / duration
-            if duration
-            else 0
-        )
-        geom1 = ftBefore.geometry()
-        geom2 = ftAfter.geometry()
-        if geom1.isNull() or geom2.isNull():
-            self.geometryLabel.setText(
-                "Interpolated position : closest record geometries are "
-                "not valid"
-            )
-            self.interpolated = QgsGeometry()
-            return
-        pt1 = geom1.asPoint()
-        pt2 = geom2.asPoint()
 
-        self.interpolated = QgsGeometry.fromPointXY(
-            QgsGeometryUtils.interpolatePointOnLine(
-                pt1.x(), pt1.y(), pt2.x(), pt2.y(), beforePercent
-            )
-        )
+        self.interpolated = QgsGeometry.fromPointXY(QgsPointXY(*position))
         self.geometryLabel.setText(
             f"Interpolated position : {self.interpolated.asWkt(3)}"
         )
@@ -216,7 +169,5 @@ class DuplicateDialog(QDialog):
 
 toDuplicate = int("[%fid%]")
 layerId = "[%@layer_id%]"
-gpsLayers = QgsProject.instance().mapLayersByName("GPS")
-if gpsLayers:
-    dlg = DuplicateDialog(toDuplicate, layerId, gpsLayers[0])
-    dlg.show()
+dlg = DuplicateDialog(toDuplicate, layerId)
+dlg.show()
@@ -3,18 +3,23 @@
 __contact__ = "info@hytech-imaging.fr"
 __copyright__ = "Copyright (c) 2022 Hytech Imaging"
 
+import time
+from collections import deque
 from datetime import datetime
 
+from qgis.PyQt.QtCore import QTimer
 from qgis.PyQt.QtGui import QColor
 
 from qgis.core import (
     QgsVectorLayer,
     QgsGeometry,
     QgsFeature,
+    QgsSettings,
     QgsVectorLayerUtils,
     QgsPointXY,
 )
 
+from ..logger import Logger
 from ..database import (
     SammoDataBase,
     GPS_TABLE,
@@ -22,18 +27,37 @@ from ..database import (
 
 from .layer import SammoLayer
 
+# default thresholds of the write-behind buffer: fixes are written to the
+# database once `FLUSH_SIZE` fixes are waiting or at most `FLUSH_INTERVAL`
+# seconds after the oldest one was received, even if no fix follows.
+FLUSH_SIZE = 10
+FLUSH_INTERVAL = 60
+
 
 class SammoGpsLayer(SammoLayer):
     def __init__(self, db: SammoDataBase):
         super().__init__(db, GPS_TABLE, "GPS")
+        self.flushSize = int(
+            QgsSettings().value("Sammo/SammoGpsLayer/FlushSize", FLUSH_SIZE)
+        )
+        self.flushInterval = int(
+            QgsSettings().value(
+                "Sammo/SammoGpsLayer/FlushInterval", FLUSH_INTERVAL
+            )
+        )
+        self._buffer = deque()
+        self._lastFlush = time.monotonic()
+        # created on the first fix, in the main thread
+        self._timer = None
 
     def _init(self, layer: QgsVectorLayer):
         symbol = layer.renderer().symbol()
         symbol.setColor(QColor(219, 30, 42))
         symbol.setSize(2)
 
-        layer.setAutoRefreshInterval(1000)
-        layer.setAutoRefreshEnabled(True)
+        # the live track is drawn on the canvas, so the layer is only
+        # repainted when fixes are written or on demand
+        layer.setAutoRefreshEnabled(False)
 
     def add(
         self,
@@ -49,7 +73,6 @@ class SammoGpsLayer(SammoLayer):
         computer: str = "",
     ) -> None:
         layer = self.layer
-        layer.startEditing()
 
         feature = QgsFeature(QgsVectorLayerUtils.createFeature(layer))
         feature.setGeometry(
@@ -74,5 +97,40 @@ class SammoGpsLayer(SammoLayer):
         if computer:
             feature.setAttribute("computer", computer)
 
-        layer.addFeature(feature)
-        layer.commitChanges()
+        self._buffer.append(feature)
+        if (
+            len(self._buffer) >= self.flushSize
+            or time.monotonic() - self._lastFlush >= self.flushInterval
+        ):
+            self.flush()
+        elif len(self._buffer) == 1:
+            # the buffer is written in time even if the GPS stops
+            if self._timer is None:
+                self._timer = QTimer()
+                self._timer.setSingleShot(True)
+                self._timer.timeout.connect(self.flush)
+            self._timer.start(self.flushInterval * 1000)
+
+    def flush(self) -> None:
+        """
+        Write all the buffered fixes to the gps table in one transaction
+        """
+        self._lastFlush = time.monotonic()
+        if self._timer:
+            self._timer.stop()
+        if not self._buffer:
+            return
+
+        layer = self.layer
+        layer.startEditing()
+        layer.addFeatures(list(self._buffer))
+        if layer.commitChanges():
+            self._buffer.clear()
+        else:
+            # fixes are kept in memory and written with the next flush
+            Logger.error(
+                "Unable to write GPS fixes: " + ", ".join(layer.commitErrors())
+            )
+            layer.rollBack()
+            if self._timer:
+                self._timer.start(self.flushInterval * 1000)
@@ -4,6 +4,8 @@ __contact__ = "info@hytech-imaging.fr"
 __copyright__ = "Copyright (c) 2021 Hytech Imaging"
 
 from pathlib import Path
+from typing import Dict
+
 from qgis.core import (
     Qgis,
     QgsAction,
@@ -17,6 +19,41 @@ from ..utils import qgisVersion
 
 NULL = "{2839923C-8B7D-419E-B84B-CA2FE9B80EC7}"
 
+# ids of the layers of the project by name, forgotten when layers are
+# removed or the project is cleared
+_PROJECT_IDS: Dict[str, str] = {}
+
+
+def projectLayer(name: str) -> QgsVectorLayer:
+    project = QgsProject.instance()
+    _watchProject(project)
+
+    layerId = _PROJECT_IDS.get(name)
+    if layerId:
+        layer = project.mapLayer(layerId)
+        if layer:
+            return layer
+
+    layers = project.mapLayersByName(name)
+    if layers:
+        _PROJECT_IDS[name] = layers[0].id()
+        return layers[0]
+    return None
+
+
+def _watchProject(project: QgsProject) -> None:
+    if getattr(_watchProject, "project", None) is project:
+        return
+    _watchProject.project = project
+    project.layerWillBeRemoved.connect(_onLayerWillBeRemoved)
+    project.cleared.connect(_PROJECT_IDS.clear)
+
+
+def _onLayerWillBeRemoved(layerId: str) -> None:
+    for name, cachedId in list(_PROJECT_IDS.items()):
+        if cachedId == layerId:
+            del _PROJECT_IDS[name]
+
 
 class SammoLayer:
     def __init__(
@@ -35,9 +72,7 @@ class SammoLayer:
 
     @property
     def layer(self) -> QgsVectorLayer:
-        if QgsProject.instance().mapLayersByName(self.name):
-            return QgsProject.instance().mapLayersByName(self.name)[0]
-        return QgsVectorLayer(self.db.tableUri(self.table), baseName=self.name)
+        return projectLayer(self.name) or self.db.layer(self.uri, self.name)
 
     @property
     def uri(self) -> str:
@@ -47,6 +82,8 @@ class SammoLayer:
         layer = self.layer
         layer.setName(self.name)
         project.addMapLayer(layer)
+        # the project owns the layer now
+        self.db.takeLayer(self.uri, self.name)
 
         if self.soundAction:
             self.addSoundAction(layer)
@@ -3,6 +3,8 @@
 __contact__ = "info@hytech-imaging.fr"
 __copyright__ = "Copyright (c) 2022 Hytech Imaging"
 
+from typing import Dict
+
 from qgis.core import QgsEditorWidgetSetup, QgsVectorLayer
 
 from ..database import (
@@ -13,6 +15,9 @@ from .layer import SammoLayer
 from .boat import SammoBoatLayer
 from .survey_type import SammoSurveyTypeLayer
 
+# fields of the survey record copied into the other tables
+VALUES = ("survey", "cycle", "computer", "shipName", "session")
+
 
 class SammoSurveyLayer(SammoLayer):
     def __init__(
@@ -24,6 +29,36 @@ class SammoSurveyLayer(SammoLayer):
         super().__init__(db, SURVEY_TABLE, "Survey")
         self.boatLayer = boatLayer
         self.surveyTypeLayer = surveyTypeLayer
+        self._values: Dict[str, object] = None
+        self._watchedId = ""
+
+    def values(self) -> Dict[str, object]:
+        """
+        Values of the survey record (empty dict if there's no record). They
+        are read once and cached until the survey table is edited.
+        """
+        layer = self.layer
+        if layer.id() != self._watchedId:
+            self._watch(layer)
+
+        if self._values is None:
+            self._values = {}
+            for feature in layer.getFeatures():
+                self._values = {name: feature[name] for name in VALUES}
+                break
+        return self._values
+
+    def invalidate(self, *args) -> None:
+        self._values = None
+
+    def _watch(self, layer: QgsVectorLayer) -> None:
+        self._watchedId = layer.id()
+        self._values = None
+        layer.featureAdded.connect(self.invalidate)
+        layer.featuresDeleted.connect(self.invalidate)
+        layer.attributeValueChanged.connect(self.invalidate)
+        layer.afterCommitChanges.connect(self.invalidate)
+        layer.afterRollBack.connect(self.invalidate)
 
     def _init(self, layer: QgsVectorLayer) -> None:
         self._init_widgets(layer)
@@ -3,17 +3,62 @@
 __contact__ = "info@hytech-imaging.fr"
 __copyright__ = "Copyright (c) 2021 Hytech Imaging"
 
+from typing import List
+
 from qgis.PyQt.QtGui import QColor
-from qgis.core import QgsVectorLayer
+from qgis.core import QgsProject, QgsVectorLayer
 
 from .layer import SammoLayer
+from ..basemap import LEVELS, levelUris
 from ..database import SammoDataBase, WORLD_TABLE
 
 
 class SammoWorldLayer(SammoLayer):
+    """
+    World basemap, read from a shared geopackage with one simplified level
+    per scale range. The most detailed level is named "World", the others
+    "World 1", "World 2"...
+    """
+
     def __init__(self, db: SammoDataBase):
         super().__init__(db, WORLD_TABLE, "World", True)
 
+    @property
+    def uri(self) -> str:
+        return levelUris()[0]
+
+    def addToProject(self, project: QgsProject) -> None:
+        for layer in self.levels():
+            project.addMapLayer(layer)
+            self._init(layer)
+
+    def levels(self) -> List[QgsVectorLayer]:
+        layers = []
+        for level, uri in enumerate(levelUris()):
+            layer = QgsVectorLayer(uri, baseName=self.levelName(level))
+
+            _, minimumScale, maximumScale = LEVELS[level]
+            layer.setScaleBasedVisibility(True)
+            layer.setMinimumScale(minimumScale)
+            layer.setMaximumScale(maximumScale)
+            layers.append(layer)
+        return layers
+
+    def levelName(self, level: int) -> str:
+        return self.name if level == 0 else f"{self.name} {level}"
+
+    def repair(self, project: QgsProject) -> None:
+        """
+        Points the World layers of a session project to the current
+        basemap when the basemap they reference is missing (removed QGIS
+        profile, session copied from another computer...)
+        """
+        for level, uri in enumerate(levelUris()):
+            name = self.levelName(level)
+            for layer in project.mapLayersByName(name):
+                if not layer.isValid():
+                    layer.setDataSource(uri, name, "ogr")
+
     def _init(self, layer: QgsVectorLayer) -> None:
         symbol = layer.renderer().symbol()
         symbolLayer = symbol.symbolLayer(0)
@@ -0,0 +1,378 @@
+# coding: utf8
+
+__contact__ = "info@hytech-imaging.fr"
+__copyright__ = "Copyright (c) 2022 Hytech Imaging"
+
+import time
+from operator import xor
+from functools import reduce
+from typing import List, Optional, Union
+
+TALKERS = (b"GP", b"GN", b"GL", b"GA")
+
+RMC = "RMC"
+GGA = "GGA"
+VTG = "VTG"
+HDT = "HDT"
+ZDA = "ZDA"
+
+NO_VALUE = -9999.0
+
+# an incomplete sentence longer than this is considered as garbage
+MAX_SENTENCE_SIZE = 1024
+
+
+class SammoFix:
+    """
+    Content of a NMEA sentence. Attributes not provided by the sentence
+    keep their default value (`NO_VALUE` for numeric values).
+    """
+
+    __slots__ = (
+        "talker",
+        "sentence",
+        "valid",
+        "hour",
+        "minute",
+        "second",
+        "millisecond",
+        "day",
+        "month",
+        "year",
+        "longitude",
+        "latitude",
+        "speed",
+        "course",
+        "heading",
+        "hdop",
+        "satellites",
+    )
+
+    def __init__(self, talker: str, sentence: str):
+        self.talker: str = talker
+        self.sentence: str = sentence
+        self.valid: bool = False
+        self.hour: int = -1
+        self.minute: int = -1
+        self.second: int = -1
+        self.millisecond: int = 0
+        self.day: int = -1
+        self.month: int = -1
+        self.year: int = -1
+        self.longitude: float = NO_VALUE
+        self.latitude: float = NO_VALUE
+        self.speed: float = NO_VALUE
+        self.course: float = NO_VALUE
+        self.heading: float = NO_VALUE
+        self.hdop: float = NO_VALUE
+        self.satellites: int = -1
+
+    @property
+    def hasTime(self) -> bool:
+        return self.hour >= 0
+
+    def copy(self) -> "SammoFix":
+        fix = SammoFix(self.talker, self.sentence)
+        for name in self.__slots__:
+            setattr(fix, name, getattr(self, name))
+        return fix
+
+    @property
+    def hasPosition(self) -> bool:
+        return self.valid and self.longitude != NO_VALUE
+
+    def __repr__(self) -> str:
+        return (
+            f"SammoFix({self.talker}{self.sentence}, "
+            f"{self.hour:02d}:{self.minute:02d}:{self.second:02d}."
+            f"{self.millisecond:03d}, lon={self.longitude}, "
+            f"lat={self.latitude}, valid={self.valid})"
+        )
+
+
+def checksum(body: bytes) -> int:
+    return reduce(xor, body, 0)
+
+
+def parse(line: Union[bytes, str]) -> Optional[SammoFix]:
+    """
+    Parse a NMEA sentence. The sentence is tokenized once and its checksum
+    is verified. None is returned for corrupted sentences or for sentences
+    not supported.
+    """
+    if isinstance(line, str):
+        line = line.encode("cp1250")
+    line = line.strip()
+
+    star = line.rfind(b"*")
+    if not line.startswith(b"$") or star < 6:
+        return None
+
+    body = line[1:star]
+    try:
+        if int(line[star + 1 : star + 3], 16) != checksum(body):
+            return None
+    except ValueError:
+        return None
+
+    if body[:2] not in TALKERS:
+        return None
+
+    fields = body.split(b",")
+    parser = _PARSERS.get(fields[0][2:])
+    if not parser:
+        return None
+
+    fix = SammoFix(fields[0][:2].decode(), fields[0][2:].decode())
+    try:
+        parser(fix, fields)
+    except (ValueError, IndexError):
+        return None
+    return fix
+
+
+def _parseTime(fix: SammoFix, value: bytes) -> None:
+    if not value:
+        return
+    fix.hour = int(value[0:2])
+    fix.minute = int(value[2:4])
+    # milliseconds are truncated, rounding could carry to the next minute
+    second, _, fraction = value[4:].partition(b".")
+    fix.second = int(second)
+    fix.millisecond = int((fraction + b"000")[:3])
+
+
+def _parseCoordinate(value: bytes, hemisphere: bytes) -> float:
+    # (d)ddmm.mmmm: the two digits before the dot are the minutes
+    if not value:
+        return NO_VALUE
+    dot = value.find(b".")
+    if dot < 0:
+        dot = len(value)
+    coordinate = int(value[: dot - 2]) + float(value[dot - 2 :]) / 60.0
+    if hemisphere in (b"S", b"W"):
+        coordinate = -coordinate
+    return coordinate
+
+
+def _parseFloat(value: bytes) -> float:
+    return float(value) if value else NO_VALUE
+
+
+def _parseRmc(fix: SammoFix, fields: list) -> None:
+    # $xxRMC,time,status,lat,N/S,lon,E/W,speed,course,date,...
+    _parseTime(fix, fields[1])
+    fix.latitude = _parseCoordinate(fields[3], fields[4])
+    fix.longitude = _parseCoordinate(fields[5], fields[6])
+    fix.speed = _parseFloat(fields[7])
+    fix.course = _parseFloat(fields[8])
+    date = fields[9]
+    if date:
+        fix.day = int(date[0:2])
+        fix.month = int(date[2:4])
+        fix.year = 2000 + int(date[4:6])
+    fix.valid = (
+        fields[2] == b"A"
+        and fix.hasTime
+        and fix.latitude != NO_VALUE
+        and fix.longitude != NO_VALUE
+    )
+
+
+def _parseGga(fix: SammoFix, fields: list) -> None:
+    # $xxGGA,time,lat,N/S,lon,E/W,quality,satellites,hdop,altitude,...
+    _parseTime(fix, fields[1])
+    fix.latitude = _parseCoordinate(fields[2], fields[3])
+    fix.longitude = _parseCoordinate(fields[4], fields[5])
+    if fields[7]:
+        fix.satellites = int(fields[7])
+    fix.hdop = _parseFloat(fields[8])
+    fix.valid = (
+        fields[6] not in (b"", b"0")
+        and fix.hasTime
+        and fix.latitude != NO_VALUE
+        and fix.longitude != NO_VALUE
+    )
+
+
+def _parseVtg(fix: SammoFix, fields: list) -> None:
+    # $xxVTG,course,T,course magnetic,M,speed knots,N,speed km/h,K,...
+    fix.course = _parseFloat(fields[1])
+    fix.speed = _parseFloat(fields[5])
+    fix.valid = fix.speed != NO_VALUE or fix.course != NO_VALUE
+
+
+def _parseHdt(fix: SammoFix, fields: list) -> None:
+    # $xxHDT,heading,T
+    fix.heading = _parseFloat(fields[1])
+    fix.valid = fix.heading != NO_VALUE
+
+
+def _parseZda(fix: SammoFix, fields: list) -> None:
+    # $xxZDA,time,day,month,year,...
+    _parseTime(fix, fields[1])
+    fix.day = int(fields[2])
+    fix.month = int(fields[3])
+    fix.year = int(fields[4])
+    fix.valid = fix.hasTime
+
+
+_PARSERS = {
+    b"RMC": _parseRmc,
+    b"GGA": _parseGga,
+    b"VTG": _parseVtg,
+    b"HDT": _parseHdt,
+    b"ZDA": _parseZda,
+}
+
+
+class SammoFixFusion:
+    """
+    Merges the sentences of a same epoch into a single fix. A fix is
+    complete as soon as all the position sentences sent by the receiver
+    for an epoch (learnt from the previous epoch) are received, or when a
+    sentence of the next epoch is received.
+    """
+
+    def __init__(self):
+        self._current: Optional[SammoFix] = None
+        self._received = set()
+        self._expected = set()
+        self._done = False
+
+    def add(self, fix: SammoFix) -> List[SammoFix]:
+        fixes = []
+        if (
+            fix.hasTime
+            and self._current
+            and self._epoch(fix) != self._epoch(self._current)
+        ):
+            if not self._done and self._current.valid:
+                fixes.append(self._current)
+            self._expected = self._received
+            self._current = None
+
+        if self._current is None:
+            if not fix.hasTime:
+                return fixes  # no epoch to attach the sentence to
+            self._current = SammoFix(fix.talker, "FIX")
+            self._received = set()
+            self._done = False
+        self._merge(self._current, fix)
+
+        if (
+            not self._done
+            and self._current.valid
+            and self._expected
+            and self._expected <= self._received
+        ):
+            # later sentences of the epoch are still merged into the current
+            # fix, so the one sent (possibly to another thread) is a copy
+            fixes.append(self._current.copy())
+            self._done = True
+        return fixes
+
+    def clear(self) -> None:
+        self._current = None
+        self._received = set()
+        self._expected = set()
+        self._done = False
+
+    def _merge(self, current: SammoFix, fix: SammoFix) -> None:
+        if fix.hasTime and not current.hasTime:
+            current.hour = fix.hour
+            current.minute = fix.minute
+            current.second = fix.second
+            current.millisecond = fix.millisecond
+        if fix.day >= 0:
+            current.day = fix.day
+            current.month = fix.month
+            current.year = fix.year
+
+        if fix.sentence in (RMC, GGA):
+            self._received.add(fix.sentence)
+            if fix.valid:
+                current.longitude = fix.longitude
+                current.latitude = fix.latitude
+                current.valid = True
+        if fix.speed != NO_VALUE and (
+            fix.sentence == RMC or current.speed == NO_VALUE
+        ):
+            current.speed = fix.speed
+        if fix.course != NO_VALUE and (
+            fix.sentence == RMC or current.course == NO_VALUE
+        ):
+            current.course = fix.course
+        if fix.heading != NO_VALUE:
+            current.heading = fix.heading
+        if fix.hdop != NO_VALUE:
+            current.hdop = fix.hdop
+        if fix.satellites >= 0:
+            current.satellites = fix.satellites
+
+    @staticmethod
+    def _epoch(fix: SammoFix) -> tuple:
+        return fix.hour, fix.minute, fix.second, fix.millisecond
+
+
+class SammoNmeaBuffer:
+    """
+    Accumulates raw bytes read from a serial port and splits out complete
+    sentences. The trailing incomplete sentence is kept for the next read.
+    """
+
+    def __init__(self):
+        self._data = bytearray()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        self._data += data
+
+        end = self._data.rfind(b"\n")
+        if end < 0:
+            if len(self._data) > MAX_SENTENCE_SIZE:
+                self._data.clear()
+            return []
+
+        lines = self._data[:end].split(b"\n")
+        del self._data[: end + 1]
+        return [bytes(line) for line in lines if line.strip()]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+def sentence(body: str) -> str:
+    """
+    Returns a complete NMEA sentence (with checksum) from its body.
+    """
+    return f"${body}*{checksum(body.encode('cp1250')):02X}"
+
+
+def benchmark(duration: float = 2.0) -> float:
+    """
+    Returns the number of sentences parsed per second.
+    """
+    lines = [
+        sentence(body).encode()
+        for body in [
+            "GNRMC,123519.20,A,4807.038,N,01131.000,E,022.4,084.4,230394,,",
+            "GNGGA,123519.20,4807.038,N,01131.000,E,1,08,0.9,545.4,M,,,,",
+            "GPVTG,084.4,T,,M,022.4,N,041.5,K,A",
+            "GPHDT,086.2,T",
+            "GPZDA,123519.20,23,03,1994,00,00",
+        ]
+    ]
+
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        for _ in range(1000):
+            for line in lines:
+                parse(line)
+        count += 1000 * len(lines)
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    # python -m src.core.nmea (from the plugin folder)
+    print(f"{benchmark():.0f} sentences/s")
@@ -0,0 +1,201 @@
+# coding: utf8
+
+__contact__ = "info@hytech-imaging.fr"
+__copyright__ = "Copyright (c) 2022 Hytech Imaging"
+
+import os
+import sys
+import gzip
+import time
+import zlib
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+
+from . import nmea
+
+# a new journal file is started when the current one reaches `ROTATE_SIZE`
+# uncompressed bytes or is older than `ROTATE_INTERVAL` seconds
+ROTATE_SIZE = 16 * 1024 * 1024
+ROTATE_INTERVAL = 3600
+
+# the compressed stream is flushed to disk at least every `FLUSH_INTERVAL`
+# seconds, so that a crash loses only the last sentences
+FLUSH_INTERVAL = 10
+
+JOURNAL_SUFFIX = ".nmea.gz"
+
+# replay speed meaning "as fast as possible"
+MAX_SPEED = 0.0
+
+
+class SammoNmeaJournal:
+    """
+    Raw NMEA journal. Each line read from the serial port is written as
+    is, prefixed by its reception time (seconds since epoch):
+
+        1700000000.125 $GPRMC,...*hh
+
+    Journal files are gzip compressed and rotated by size and age.
+    """
+
+    def __init__(self, directory: Union[Path, str]):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._file: Optional[gzip.GzipFile] = None
+        self._size = 0
+        self._opened = 0.0
+        self._lastFlush = 0.0
+
+    @staticmethod
+    def fromSettings() -> Optional["SammoNmeaJournal"]:
+        """
+        Returns a journal if enabled through the SAMMO_NMEA_JOURNAL
+        environment variable or the Sammo/SammoNmeaJournal/Directory
+        setting, None otherwise.
+        """
+        directory = os.environ.get("SAMMO_NMEA_JOURNAL")
+        if not directory:
+            from qgis.core import QgsSettings
+
+            directory = QgsSettings().value(
+                "Sammo/SammoNmeaJournal/Directory", ""
+            )
+        if not directory:
+            return None
+        return SammoNmeaJournal(directory)
+
+    def write(self, line: bytes, epoch: Optional[float] = None) -> None:
+        now = time.monotonic()
+        if not self._file or (
+            self._size >= ROTATE_SIZE or now - self._opened >= ROTATE_INTERVAL
+        ):
+            self._rotate()
+
+        if epoch is None:
+            epoch = time.time()
+        record = b"%.3f %s\n" % (epoch, line.rstrip(b"\r\n"))
+        self._file.write(record)
+        self._size += len(record)
+
+        if now - self._lastFlush >= FLUSH_INTERVAL:
+            self._file.flush(zlib.Z_SYNC_FLUSH)
+            self._lastFlush = now
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self) -> None:
+        self.close()
+        name = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        path = self.directory / f"{name}{JOURNAL_SUFFIX}"
+        self._file = gzip.open(path, "wb")
+        self._size = 0
+        self._opened = self._lastFlush = time.monotonic()
+
+
+def journalFiles(path: Union[Path, str]) -> List[Path]:
+    """
+    Returns the journal files of a directory in chronological order, or the
+    file itself.
+    """
+    path = Path(path)
+    if path.is_dir():
+        return sorted(path.glob(f"*{JOURNAL_SUFFIX}"))
+    return [path]
+
+
+def records(path: Union[Path, str]) -> Iterator[Tuple[float, bytes]]:
+    """
+    Yields (reception time, raw line) records of a journal file or
+    directory. A truncated file (after a crash) is read up to its last
+    complete record.
+    """
+    for filename in journalFiles(path):
+        opener = gzip.open if filename.suffix == ".gz" else open
+        with opener(filename, "rb") as f:
+            try:
+                for record in f:
+                    epoch, _, line = record.rstrip(b"\r\n").partition(b" ")
+                    try:
+                        yield float(epoch), line
+                    except ValueError:
+                        continue
+            except (EOFError, zlib.error):
+                continue
+
+
+def replay(
+    items: Iterator[Tuple[float, bytes]],
+    speed: float = 1.0,
+    sleep: Callable[[float], None] = time.sleep,
+    clock: Callable[[], float] = time.monotonic,
+) -> Iterator[bytes]:
+    """
+    Yields the lines of journal records, paced according to their
+    reception times divided by `speed` (no pacing with `MAX_SPEED`). The
+    pacing follows `clock`, which may be stopped while the replay is
+    paused.
+    """
+    start = None
+    for epoch, line in items:
+        if speed > 0:
+            if start is None:
+                start = (epoch, clock())
+            delay = (epoch - start[0]) / speed - (clock() - start[1])
+            if delay > 0:
+                sleep(delay)
+        yield line
+
+
+def parseSpeed(value: str) -> float:
+    """
+    Returns a replay speed from "1", "10x", "max", ...
+    """
+    value = value.strip().lower().rstrip("x×")
+    if not value or value == "max":
+        return MAX_SPEED
+    return float(value)
+
+
+def benchmark(path: Union[Path, str], speed: float = MAX_SPEED) -> dict:
+    """
+    Replays a journal through the parser and the fusion, and returns
+    statistics about the ingestion.
+    """
+    buffer = nmea.SammoNmeaBuffer()
+    fusion = nmea.SammoFixFusion()
+    lines = sentences = fixes = 0
+
+    start = time.perf_counter()
+    for line in replay(records(path), speed):
+        lines += 1
+        for sentence in buffer.feed(line + b"\n"):
+            fix = nmea.parse(sentence)
+            if fix:
+                sentences += 1
+                fixes += len(fusion.add(fix))
+    duration = time.perf_counter() - start
+
+    return {
+        "lines": lines,
+        "sentences": sentences,
+        "fixes": fixes,
+        "duration": duration,
+        "rate": lines / duration if duration else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    # python -m src.core.nmea_journal <journal> [speed] (from plugin folder)
+    if len(sys.argv) < 2:
+        sys.exit("usage: nmea_journal <file or directory> [1|10|100|max]")
+    stats = benchmark(
+        sys.argv[1], parseSpeed(sys.argv[2] if len(sys.argv) > 2 else "max")
+    )
+    print(
+        "{lines} lines, {sentences} sentences, {fixes} fixes "
+        "in {duration:.2f} s ({rate:.0f} lines/s)".format(**stats)
+    )
@@ -4,6 +4,7 @@ __contact__ = "info@hytech-imaging.fr"
 __copyright__ = "Copyright (c) 2021 Hytech Imaging"
 
 from abc import abstractmethod
+from qgis.PyQt import sip
 from qgis.PyQt.QtCore import QThread, QObject, pyqtSignal
 from .logger import Logger
 
@@ -59,9 +60,12 @@ class OtherThread(QObject):
         self.isProceeding = True
 
     def stop(self):
-        self.worker.stop()
-        self.thread.quit()
-        self.thread.wait()
+        # the thread is deleted once its worker has finished by itself
+        if not sip.isdeleted(self.worker):
+            self.worker.stop()
+        if not sip.isdeleted(self.thread):
+            self.thread.quit()
+            self.thread.wait()
         self.isProceeding = False
 
     def log(self, msg: str):
@@ -0,0 +1,137 @@
+# coding: utf8
+
+__contact__ = "info@hytech-imaging.fr"
+__copyright__ = "Copyright (c) 2022 Hytech Imaging"
+
+from array import array
+from typing import Callable, Iterable, Optional, Tuple
+
+import numpy as np
+
+# returns the (epoch, longitude, latitude) columns known before the index
+# is used for the first time
+Loader = Callable[[], Iterable[Tuple[Iterable, Iterable, Iterable]]]
+
+
+class SammoPositionIndex:
+    """
+    Position of the boat at any time, linearly interpolated between the
+    two bracketing fixes.
+
+    Fixes are kept in sorted NumPy arrays of epoch, longitude and latitude.
+    New fixes are appended to packed arrays and merged into the sorted
+    arrays on the next lookup only, so appending is cheap. The fixes
+    recorded before the session was opened are loaded on the first lookup
+    from the GPS table, which is indexed with the computer time like the
+    observations. The full-rate track is indexed with the GPS time, so it
+    is not used.
+    """
+
+    def __init__(self, loader: Optional[Loader] = None):
+        self._loader = loader
+        self._epochs = np.empty(0)
+        self._longitudes = np.empty(0)
+        self._latitudes = np.empty(0)
+        self._pending = (array("d"), array("d"), array("d"))
+
+    def __len__(self) -> int:
+        self._consolidate()
+        return len(self._epochs)
+
+    def append(self, epoch: float, longitude: float, latitude: float) -> None:
+        for column, value in zip(self._pending, (epoch, longitude, latitude)):
+            column.append(value)
+
+    def clear(self) -> None:
+        self._loader = None
+        self._epochs = np.empty(0)
+        self._longitudes = np.empty(0)
+        self._latitudes = np.empty(0)
+        self._pending = (array("d"), array("d"), array("d"))
+
+    def bounds(self) -> Optional[Tuple[float, float]]:
+        self._consolidate()
+        if not len(self._epochs):
+            return None
+        return float(self._epochs[0]), float(self._epochs[-1])
+
+    def position(self, epoch: float) -> Optional[Tuple[float, float]]:
+        """
+        Returns the (longitude, latitude) at epoch, None if epoch is not
+        between the first and the last fixes.
+        """
+        self._consolidate()
+        epochs = self._epochs
+        if not len(epochs) or epoch < epochs[0] or epoch > epochs[-1]:
+            return None
+
+        after = int(np.searchsorted(epochs, epoch))
+        if epochs[after] == epoch:
+            return float(self._longitudes[after]), float(
+                self._latitudes[after]
+            )
+
+        before = after - 1
+        ratio = (epoch - epochs[before]) / (epochs[after] - epochs[before])
+        longitude = self._longitudes[before] + ratio * (
+            self._longitudes[after] - self._longitudes[before]
+        )
+        latitude = self._latitudes[before] + ratio * (
+            self._latitudes[after] - self._latitudes[before]
+        )
+        return float(longitude), float(latitude)
+
+    def positions(self, epochs: Iterable[float]) -> Tuple[np.ndarray, ...]:
+        """
+        Returns the longitudes and latitudes at several epochs at once, NaN
+        where an epoch is out of bounds.
+        """
+        self._consolidate()
+        epochs = np.asarray(epochs, dtype=float)
+        if not len(self._epochs):
+            nan = np.full(epochs.shape, np.nan)
+            return nan, nan.copy()
+        longitudes = np.interp(
+            epochs, self._epochs, self._longitudes, np.nan, np.nan
+        )
+        latitudes = np.interp(
+            epochs, self._epochs, self._latitudes, np.nan, np.nan
+        )
+        return longitudes, latitudes
+
+    def _consolidate(self) -> None:
+        columns = []
+        if self._loader:
+            columns += [
+                tuple(np.asarray(c, dtype=float) for c in loaded)
+                for loaded in self._loader()
+            ]
+            self._loader = None
+        if len(self._pending[0]):
+            columns.append(tuple(np.frombuffer(c) for c in self._pending))
+            self._pending = (array("d"), array("d"), array("d"))
+        if not columns:
+            return
+
+        epochs = np.concatenate([self._epochs] + [c[0] for c in columns])
+        longitudes = np.concatenate(
+            [self._longitudes] + [c[1] for c in columns]
+        )
+        latitudes = np.concatenate([self._latitudes] + [c[2] for c in columns])
+
+        # fixes usually arrive in order, so sorting is rarely needed
+        if np.any(np.diff(epochs) <= 0):
+            order = np.argsort(epochs, kind="stable")
+            epochs = epochs[order]
+            longitudes = longitudes[order]
+            latitudes = latitudes[order]
+
+            # keep the last fix received for a same epoch
+            keep = np.append(np.diff(epochs) > 0, True)
+            epochs = epochs[keep]
+            longitudes = longitudes[keep]
+            latitudes = latitudes[keep]
+
+        self._epochs = epochs
+        self._longitudes = longitudes
+        self._latitudes = latitudes
@@ -3,20 +3,21 @@
 __contact__ = "info@hytech-imaging.fr"
 __copyright__ = "Copyright (c) 2022 Hytech Imaging"
 
+import math
 from pathlib import Path
 from datetime import datetime
-from typing import List, Optional, Dict, Union
+from typing import List, Optional, Dict, Tuple, Union
 
 from qgis.PyQt.QtGui import QColor
-from qgis.PyQt.QtWidgets import QMessageBox
 
 from qgis.utils import iface
 from qgis.core import (
+    NULL,
     QgsProject,
+    QgsPointXY,
     QgsGeometry,
     QgsMapLayer,
     QgsSettings,
-    QgsExpression,
     QgsApplication,
     QgsVectorLayer,
     QgsFeatureRequest,
@@ -26,6 +27,7 @@ from qgis.core import (
 )
 
 from . import utils
+from .logger import Logger
 from .status import StatusCode
 from .database import (
     DB_NAME,
@@ -46,8 +48,18 @@ from .layers import (
     SammoEnvironmentLayer,
     SammoBehaviourSpeciesLayer,
 )
+from .basemap import basemapPath
+from .track_store import SammoTrackStore
+from .position import SammoPositionIndex
+from .effort import SammoEffortTracker
+from .group_commit import SammoGroupCommit
+from .attribution import SammoEnvironmentIntervals
+from .effort_check import SammoEffortReport, checkEffort
 from .sound_recording_controller import RecordType
 
+# default period in seconds between two fixes written in the gps table
+CAPTURE_INTERVAL = 60
+
 
 class SammoSession:
     def __init__(self):
@@ -78,11 +90,20 @@ class SammoSession:
             "datetime": None,
         }
         self.lastCaptureTime: datetime = datetime(1900, 1, 1, 0, 0, 0)
+        self.track: Optional[SammoTrackStore] = None
+        self.captureInterval: int = CAPTURE_INTERVAL
+        self.positions = SammoPositionIndex()
+        self.effort: Optional[SammoEffortTracker] = None
+        self.commits: Optional[SammoGroupCommit] = None
 
     @property
     def audioFolder(self) -> Path:
         return Path(self.db.directory) / "audio"
 
+    @property
+    def trackFolder(self) -> Path:
+        return Path(self.db.directory) / "track"
+
     @property
     def environmentLayer(self) -> QgsVectorLayer:
         if self._environmentLayer:
@@ -169,6 +190,20 @@ class SammoSession:
         if not (Path(directory) / "audio").exists():
             (Path(directory) / "audio").mkdir()
 
+        # full-rate track and decimation of the gps table
+        settings = QgsSettings()
+        self.captureInterval = int(
+            settings.value(
+                "Sammo/SammoSession/CaptureInterval", CAPTURE_INTERVAL
+            )
+        )
+        self.track = None
+        if load and settings.value(
+            "Sammo/SammoSession/FullRate", False, type=bool
+        ):
+            self.track = SammoTrackStore(self.trackFolder)
+        self.positions = SammoPositionIndex(self._loadPositions)
+
         self._worldLayer = SammoWorldLayer(self.db)
 
         # Administrator table
@@ -233,7 +268,10 @@ class SammoSession:
 
         # read project
         if load:
+            # the shared basemap is rebuilt if missing before being read
+            basemapPath()
             QgsProject.instance().read(self.db.projectUri)
+            self._worldLayer.repair(QgsProject.instance())
             for layer in [
                 self._gpsLayer,
                 self._boatLayer,
@@ -263,16 +301,20 @@ class SammoSession:
             self._followersLayer.addSoundAction(self.followersLayer)
             self._sightingsLayer.addDuplicateAction(self.followersLayer)
             QgsSettings().setValue("qgis/enableMacros", "SessionOnly")
+            self.effort = SammoEffortTracker(self.environmentLayer)
+            self.commits = SammoGroupCommit(
+                [
+                    self.environmentLayer,
+                    self.sightingsLayer,
+                    self.followersLayer,
+                ]
+            )
             self.environmentLayer.attributeValueChanged.connect(
                 self.updateRouteTypeStatus
             )
 
     def surveyValues(self, layer: QgsVectorLayer) -> tuple:
-        survey = (
-            next(self.surveyLayer.getFeatures())
-            if self.surveyLayer.featureCount() > 0
-            else None
-        )
+        survey = self._surveyLayer.values()
         if (
             not survey
             or not survey["survey"]
@@ -321,18 +363,10 @@ class SammoSession:
         ) = self.surveyValues(layer)
 
         # EffortGroup management
-        effortGroup = max(
-            layer.maximumValue(layer.fields().indexOf("_effortGroup")), 0
-        )
+        effortGroup = self.effort.maxGroup
         if effortGroup and statusCode == StatusCode.display(StatusCode.BEGIN):
             effortGroup += 1
-        effortLeg = 0
-        for ft in layer.getFeatures(
-            QgsFeatureRequest(QgsExpression(f"_effortGroup = {effortGroup}"))
-        ):
-            if ft["_effortLeg"] > effortLeg:
-                effortLeg = ft["_effortLeg"]
-        effortLeg += 1
+        effortLeg = self.effort.maxLeg(effortGroup) + 1
 
         self._addFeature(
             layer,
@@ -368,34 +402,31 @@ class SammoSession:
             self.environmentLayer
             and idx == self.environmentLayer.fields().indexOf("routeType")
         ):
-            feat = self.environmentLayer.getFeature(fid)
-            request = QgsFeatureRequest().addOrderBy("dateTime", False)
-            for prevFeat in self.environmentLayer.getFeatures(request):
-                if prevFeat["fid"] == feat["fid"]:
-                    continue
-                elif prevFeat["routeType"] == feat["routeType"]:
-                    self.environmentLayer.changeAttributeValue(
-                        fid,
-                        self.environmentLayer.fields().indexOf("_effortGroup"),
-                        prevFeat["_effortGroup"],
-                    )
-                elif prevFeat["routeType"] != feat["routeType"]:
-                    self.environmentLayer.changeAttributeValue(
-                        fid,
-                        self.environmentLayer.fields().indexOf("status"),
-                        StatusCode.display(StatusCode.BEGIN),
-                    )
-                    self.environmentLayer.changeAttributeValue(
-                        fid,
-                        self.environmentLayer.fields().indexOf("_effortGroup"),
-                        prevFeat["_effortGroup"] + 1,
-                    )
-                    self.environmentLayer.changeAttributeValue(
-                        fid,
-                        self.environmentLayer.fields().indexOf("_effortLeg"),
-                        1,
-                    )
-                break
+            prevFeat = self.effort.latest(exclude=fid)
+            if not prevFeat:
+                return
+            elif prevFeat.routeType == value:
+                self.environmentLayer.changeAttributeValue(
+                    fid,
+                    self.environmentLayer.fields().indexOf("_effortGroup"),
+                    prevFeat.effortGroup,
+                )
+            else:
+                self.environmentLayer.changeAttributeValue(
+                    fid,
+                    self.environmentLayer.fields().indexOf("status"),
+                    StatusCode.display(StatusCode.BEGIN),
+                )
+                self.environmentLayer.changeAttributeValue(
+                    fid,
+                    self.environmentLayer.fields().indexOf("_effortGroup"),
+                    prevFeat.effortGroup + 1,
+                )
+                self.environmentLayer.changeAttributeValue(
+                    fid,
+                    self.environmentLayer.fields().indexOf("_effortLeg"),
+                    1,
+                )
 
     def addSightingsFeature(self) -> QgsVectorLayer:
         layer = self.sightingsLayer
@@ -445,35 +476,29 @@ class SammoSession:
             _effortLeg=effortLeg,
         )
 
-    def needsSaving(self) -> None:
-        for layer in [
-            self.environmentLayer,
-            self.sightingsLayer,
-            self.followersLayer,
-        ]:
-            if not layer:
-                continue
+    def needsSaving(self) -> bool:
+        if self.commits:
+            return self.commits.isDirty()
+        return False
 
-            if not layer.editBuffer():
-                continue
+    def pendingChanges(self) -> Dict[str, int]:
+        """
+        Number of records changed and not saved yet, per table
+        """
+        if self.commits:
+            return self.commits.pendingChanges()
+        return {}
 
-            if (
-                len(
-                    set(
-                        list(layer.editBuffer().addedFeatures().keys())
-                        + list(
-                            layer.editBuffer().changedAttributeValues().keys()
-                        )
-                        + list(layer.editBuffer().changedGeometries().keys())
-                    )
-                )
-                != 0
-            ):
-                return True
+    def saveAll(self) -> None:
+        if self._gpsLayer:
+            self._gpsLayer.flush()
+        if self.track:
+            self.track.flush()
 
-        return False
+        if self.commits:
+            self.commits.flush()
+            return
 
-    def saveAll(self) -> None:
         for layer in [
             self.environmentLayer,
             self.sightingsLayer,
@@ -484,6 +509,30 @@ class SammoSession:
             layer.commitChanges()
             layer.startEditing()
 
+    def scheduleSave(self) -> None:
+        """
+        Saves the observation tables at the end of the commit window, or
+        at once if the session is not loaded yet
+        """
+        if self.commits:
+            self.commits.schedule()
+        else:
+            self.saveAll()
+
+    def close(self) -> None:
+        # buffered gps fixes and edits have to be written before the session
+        # is left
+        if self._gpsLayer:
+            self._gpsLayer.flush()
+        if self.track:
+            self.track.flush()
+        if self.commits:
+            self.commits.flush()
+        self.db.releaseLayers()
+        # the durability profile is kept while the session is open, so that
+        # the connections reopened on edition get it too
+        self.db.restoreDurability()
+
     def validate(self, merge=False) -> None:
         selectedMode = bool(
             self.environmentLayer.selectedFeatureCount()
@@ -491,8 +540,6 @@ class SammoSession:
             + self.followersLayer.selectedFeatureCount()
         )
 
-        self.effortCheck(self.environmentLayer)
-
         def validateFeatures(selectedLayer: QgsVectorLayer) -> None:
             selectedLayer.startEditing()
             featuresIterator = (
@@ -522,6 +569,66 @@ class SammoSession:
         ):
             validateFeatures(layer)
 
+    def repairGeometries(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Locates the observations recorded without geometry (GPS offline) by
+        interpolating the GPS track at their datetime. Returns the number of
+        repaired and still unlocated records per layer.
+        """
+        layers = [
+            self.environmentLayer,
+            self.sightingsLayer,
+            self.followersLayer,
+        ]
+
+        # pending edits are saved first, so that the commits below only
+        # contain the repaired geometries
+        self.saveAll()
+
+        # records without geometry of all layers
+        missing = []
+        for layer in layers:
+            layer.startEditing()
+            request = QgsFeatureRequest()
+            request.setSubsetOfAttributes(["dateTime"], layer.fields())
+            for feature in layer.getFeatures(request):
+                if feature.geometry().isNull() and feature["dateTime"]:
+                    epoch = feature["dateTime"].toPyDateTime().timestamp()
+                    missing.append((layer, feature.id(), epoch))
+
+        # interpolate all the positions at once
+        longitudes, latitudes = self.positions.positions(
+            [epoch for _, _, epoch in missing]
+        )
+
+        report = {layer.name(): [0, 0] for layer in layers}
+        for (layer, fid, _), longitude, latitude in zip(
+            missing, longitudes, latitudes
+        ):
+            if math.isnan(longitude):
+                report[layer.name()][1] += 1
+                continue
+            if layer.changeGeometry(
+                fid,
+                QgsGeometry.fromPointXY(QgsPointXY(longitude, latitude)),
+            ):
+                report[layer.name()][0] += 1
+            else:
+                report[layer.name()][1] += 1
+
+        for layer in layers:
+            if not report[layer.name()][0]:
+                continue
+            if not layer.commitChanges():
+                Logger.error(
+                    f"Unable to repair {layer.name()} geometries: "
+                    + ", ".join(layer.commitErrors())
+                )
+                report[layer.name()] = [0, sum(report[layer.name()])]
+            layer.startEditing()
+
+        return {name: tuple(counts) for name, counts in report.items()}
+
     def onStopSoundRecordingForEvent(
         self,
         recordType: RecordType,
@@ -549,7 +656,37 @@ class SammoSession:
         field_idx = table.fields().indexOf("soundEnd")
         table.changeAttributeValue(idLastAddedFeature, field_idx, soundEnd)
 
-        self.saveAll()
+        self.scheduleSave()
+
+    def addTrack(
+        self,
+        dt: datetime,
+        longitude: float,
+        latitude: float,
+        speed: float = -9999.0,
+        course: float = -9999.0,
+    ) -> None:
+        # positions are indexed with the computer time, like the dateTime
+        # field of the tables
+        self.positions.append(datetime.now().timestamp(), longitude, latitude)
+
+        if self.track is None:
+            return
+        self.track.append(dt.timestamp(), longitude, latitude, speed, course)
+
+    def _loadPositions(self) -> List[tuple]:
+        epochs, longitudes, latitudes = [], [], []
+        request = QgsFeatureRequest()
+        request.setSubsetOfAttributes(["dateTime"], self.gpsLayer.fields())
+        for feature in self.gpsLayer.getFeatures(request):
+            geometry = feature.geometry()
+            if geometry.isNull() or not feature["dateTime"]:
+                continue
+            point = geometry.asPoint()
+            epochs.append(feature["dateTime"].toPyDateTime().timestamp())
+            longitudes.append(point.x())
+            latitudes.append(point.y())
+        return [(epochs, longitudes, latitudes)]
 
     def addGps(
         self,
@@ -564,11 +701,11 @@ class SammoSession:
         survey = ""
         cycle = ""
         computer = ""
-        if self.surveyLayer.featureCount() > 0:
-            ft = next(self.surveyLayer.getFeatures())
-            survey = ft["survey"]
-            cycle = ft["cycle"]
-            computer = ft["computer"]
+        values = self._surveyLayer.values()
+        if values:
+            survey = values["survey"]
+            cycle = values["cycle"]
+            computer = values["computer"]
         self._gpsLayer.add(
             longitude,
             latitude,
@@ -603,6 +740,11 @@ class SammoSession:
                 "No geometry available, please check gps status",
             )
 
+        # the followers workaround below needs the committed id of the last
+        # feature
+        if self.commits and layer == self.followersLayer:
+            self.commits.flush()
+
         lastFeat = SammoDataBase.lastFeature(layer)
         if lastFeat:
             if layer == self.sightingsLayer:
@@ -644,12 +786,11 @@ class SammoSession:
             layer.startEditing()
         layer.addFeature(feat)
 
-        self.saveAll()
-
         # Bug for the first duplicate line in a follower table,
         # back attr changes without explanation in the duplicated feature...
         # this fixe it after the processEvents()
         if lastFeat and layer == self.followersLayer:
+            self.saveAll()
             lastFid = lastFeat.id()
             QgsApplication.processEvents()
             layer.changeAttributeValue(
@@ -658,6 +799,8 @@ class SammoSession:
                 lastFeat.attribute("back"),
             )
             self.saveAll()
+        else:
+            self.scheduleSave()
 
     @staticmethod
     def sessionDirectory(project: QgsProject) -> str:
@@ -672,34 +815,40 @@ class SammoSession:
         return ""
 
     @staticmethod
-    def effortCheck(environmentLayer) -> None:
-        # effort status check
-        effortIds = environmentLayer.uniqueValues(
-            environmentLayer.fields().indexOf("_effortGroup")
+    def effortCheck(
+        environmentLayer: QgsVectorLayer,
+        sightingsLayer: QgsVectorLayer = None,
+        followersLayer: QgsVectorLayer = None,
+    ) -> SammoEffortReport:
+        def rows(layer: QgsVectorLayer, names: List[str], ordered: bool):
+            request = QgsFeatureRequest()
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+            request.setSubsetOfAttributes(names, layer.fields())
+            if ordered:
+                request.addOrderBy("dateTime")
+                request.addOrderBy("fid")
+            for ft in layer.getFeatures(request):
+                values = [ft[name] for name in names]
+                values = [None if v == NULL else v for v in values]
+                if values[0] is not None:
+                    values[0] = values[0].toPyDateTime()
+                yield tuple([ft.id()] + values)
+
+        observations = {
+            layer.name(): rows(layer, ["dateTime", "_effortGroup"], False)
+            for layer in (sightingsLayer, followersLayer)
+            if layer
+        }
+        report = checkEffort(
+            rows(
+                environmentLayer,
+                ["dateTime", "_effortGroup", "_effortLeg", "status"],
+                True,
+            ),
+            observations,
         )
-        errors = []
-        for effortId in effortIds:
-            effortIt = environmentLayer.getFeatures(
-                QgsFeatureRequest().setFilterExpression(
-                    f"_effortGroup = {effortId}"
-                )
-            )
-            statusCodes = {ft["datetime"]: ft["status"] for ft in effortIt}
-            if (
-                StatusCode.display(StatusCode.BEGIN)
-                not in statusCodes.values()
-            ):
-                errors.append(
-                    f"Missing BEGIN code for effortGroup {effortId} (before "
-                    f"{min(statusCodes).toPyDateTime().isoformat()} record)"
-                )
-
-        if errors:
-            errors.append("Please, resolve errors before validation")
-            QMessageBox.warning(
-                None, "Errors detected in effort status", "\n".join(errors)
-            )
-            return
+        Logger.log(f"Effort check: {report.summary()}")
+        return report
 
     @staticmethod
     def applyEnvAttr(
@@ -707,66 +856,8 @@ class SammoSession:
         sightingsLayer: QgsVectorLayer,
         followersLayer: QgsVectorLayer,
     ) -> None:
-        # Sightings
-        sightingsLayer.startEditing()
-        for feat in sightingsLayer.getFeatures():
-            strDateTime = (
-                feat["dateTime"].toPyDateTime().strftime("%Y-%m-%d %H:%M:%S")
-            )
-            request = QgsFeatureRequest().setFilterExpression(
-                f"dateTime < to_datetime('{strDateTime}') "
-            )
-            request.addOrderBy("dateTime", False)
-            for envFeat in environmentLayer.getFeatures(request):
-                if feat["side"] == "L":
-                    sightingsLayer.changeAttributeValue(
-                        feat.id(),
-                        sightingsLayer.fields().indexOf("observer"),
-                        envFeat["left"],
-                    )
-                elif feat["side"] == "R":
-                    sightingsLayer.changeAttributeValue(
-                        feat.id(),
-                        sightingsLayer.fields().indexOf("observer"),
-                        envFeat["right"],
-                    )
-                elif feat["side"] == "C":
-                    sightingsLayer.changeAttributeValue(
-                        feat.id(),
-                        sightingsLayer.fields().indexOf("observer"),
-                        envFeat["center"],
-                    )
-                sightingsLayer.changeAttributeValue(
-                    feat.id(),
-                    sightingsLayer.fields().indexOf("_effortGroup"),
-                    envFeat["_effortGroup"],
-                )
-                sightingsLayer.changeAttributeValue(
-                    feat.id(),
-                    sightingsLayer.fields().indexOf("_effortLeg"),
-                    envFeat["_effortLeg"],
-                )
-                break
-        sightingsLayer.commitChanges()
-        sightingsLayer.startEditing()
-
-        # Followers
-        followersLayer.startEditing()
-        for feat in followersLayer.getFeatures():
-            strDateTime = (
-                feat["dateTime"].toPyDateTime().strftime("%Y-%m-%d %H:%M:%S")
-            )
-            request = QgsFeatureRequest().setFilterExpression(
-                f"dateTime < to_datetime('{strDateTime}') "
-            )
-            request.addOrderBy("dateTime", False)
-            for envFeat in environmentLayer.getFeatures(request):
-                followersLayer.changeAttributeValue(
-                    feat.id(),
-                    followersLayer.fields().indexOf("_effortGroup"),
-                    envFeat["_effortGroup"],
-                )
-                break
-
-        followersLayer.commitChanges()
-        followersLayer.startEditing()
+        environment = SammoEnvironmentIntervals(environmentLayer)
+        environment.apply(
+            sightingsLayer, ["observer", "_effortGroup", "_effortLeg"]
+        )
+        environment.apply(followersLayer, ["_effortGroup"])
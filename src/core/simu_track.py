@@ -0,0 +1,143 @@
+# coding: utf8
+
+__contact__ = "info@hytech-imaging.fr"
+__copyright__ = "Copyright (c) 2022 Hytech Imaging"
+
+import math
+import random
+from datetime import datetime
+from typing import List, Tuple
+
+from . import nmea
+
+EARTH_RADIUS = 6371000.0  # meters
+KNOT = 1852.0 / 3600.0  # meters per second
+
+# legs length in nautical miles
+LEG_MIN = 5.0
+LEG_MAX = 40.0
+
+# boat speed in knots
+SPEED_MIN = 7.0
+SPEED_MAX = 11.0
+
+# turn rate in degrees per second between two legs
+TURN_RATE = 3.0
+
+# standard deviation of the position noise in meters
+POSITION_NOISE = 3.0
+
+
+class SammoTrackSynthesizer:
+    """
+    Procedural boat track: great-circle legs of random length and course,
+    linked by turns at a constant rate, with noise on the position, speed
+    and course. The same seed always gives the same track.
+    """
+
+    def __init__(
+        self,
+        longitude: float = -4.87,
+        latitude: float = 48.27,
+        rate: float = 1.0,
+        seed: int = 0,
+    ):
+        self.longitude = longitude
+        self.latitude = latitude
+        self.rate = rate
+        self._random = random.Random(seed)
+        self._course = self._random.uniform(0, 360)
+        self._speed = self._random.uniform(SPEED_MIN, SPEED_MAX)
+        self._target = self._course
+        self._remaining = 0.0  # meters until the end of the leg
+
+    def next(self) -> Tuple[float, float, float, float]:
+        """
+        Returns the next (longitude, latitude, speed, course), 1 / rate
+        seconds after the previous one.
+        """
+        dt = 1.0 / self.rate
+        if self._remaining <= 0:
+            self._newLeg()
+
+        # turn towards the course of the current leg
+        delta = (self._target - self._course + 540) % 360 - 180
+        step = TURN_RATE * dt
+        self._course = (self._course + max(-step, min(step, delta))) % 360
+
+        distance = self._speed * KNOT * dt
+        self._remaining -= distance
+        self.longitude, self.latitude = self._move(
+            self.longitude, self.latitude, self._course, distance
+        )
+
+        noise = self._random.gauss
+        longitude, latitude = self._move(
+            self.longitude,
+            self.latitude,
+            self._random.uniform(0, 360),
+            abs(noise(0, POSITION_NOISE)),
+        )
+        speed = max(0.0, self._speed + noise(0, 0.2))
+        course = (self._course + noise(0, 1.0)) % 360
+        return longitude, latitude, speed, course
+
+    def _newLeg(self) -> None:
+        self._remaining = self._random.uniform(LEG_MIN, LEG_MAX) * 1852.0
+        self._target = (self._course + self._random.uniform(-150, 150)) % 360
+        self._speed = self._random.uniform(SPEED_MIN, SPEED_MAX)
+
+    @staticmethod
+    def _move(
+        longitude: float, latitude: float, course: float, distance: float
+    ) -> Tuple[float, float]:
+        # destination point along a great circle
+        angle = distance / EARTH_RADIUS
+        lat1 = math.radians(latitude)
+        lon1 = math.radians(longitude)
+        bearing = math.radians(course)
+
+        lat2 = math.asin(
+            math.sin(lat1) * math.cos(angle)
+            + math.cos(lat1) * math.sin(angle) * math.cos(bearing)
+        )
+        lon2 = lon1 + math.atan2(
+            math.sin(bearing) * math.sin(angle) * math.cos(lat1),
+            math.cos(angle) - math.sin(lat1) * math.sin(lat2),
+        )
+        longitude = (math.degrees(lon2) + 540) % 360 - 180
+        return longitude, math.degrees(lat2)
+
+
+def _coordinate(value: float, positive: str, negative: str, size: int):
+    hemisphere = positive if value >= 0 else negative
+    value = abs(value)
+    degrees = int(value)
+    minutes = (value - degrees) * 60
+    return f"{degrees:0{size}d}{minutes:07.4f}", hemisphere
+
+
+def sentences(
+    dt: datetime,
+    longitude: float,
+    latitude: float,
+    speed: float,
+    course: float,
+    talker: str = "GN",
+) -> List[bytes]:
+    """
+    Returns the RMC and GGA sentences of a position.
+    """
+    time = dt.strftime("%H%M%S.") + f"{dt.microsecond // 10000:02d}"
+    date = dt.strftime("%d%m%y")
+    lat, ns = _coordinate(latitude, "N", "S", 2)
+    lon, ew = _coordinate(longitude, "E", "W", 3)
+    return [
+        nmea.sentence(
+            f"{talker}RMC,{time},A,{lat},{ns},{lon},{ew},"
+            f"{speed:.1f},{course:.1f},{date},,,A"
+        ).encode(),
+        nmea.sentence(
+            f"{talker}GGA,{time},{lat},{ns},{lon},{ew},1,10,0.9,12.0,M,,,,"
+        ).encode(),
+    ]
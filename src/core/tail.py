@@ -0,0 +1,121 @@
+# coding: utf8
+
+__contact__ = "info@hytech-imaging.fr"
+__copyright__ = "Copyright (c) 2022 Hytech Imaging"
+
+from typing import Dict, List, Optional, Tuple
+
+from qgis.core import QgsFeature, QgsVectorLayer, QgsFeatureRequest
+
+from .status import StatusCode
+
+
+def _rank(fid: int) -> Tuple[int, int]:
+    # features not committed yet (negative ids, decreasing as they are
+    # added) are more recent than the committed ones
+    return (1, -fid) if fid < 0 else (0, fid)
+
+
+class SammoLayerTail:
+    """
+    Id of the last feature of a layer (the most recently added, committed
+    or not), kept up to date from the edit signals of the layer. With
+    `skipEnd`, features with an END status are ignored.
+
+    The layer is only scanned when the cached id can't be deduced from a
+    signal (deletion of the last feature, rollback, status change...).
+    """
+
+    def __init__(self, layer: QgsVectorLayer, skipEnd: bool = False):
+        self.layer = layer
+        self.skipEnd = skipEnd
+        self._fid: Optional[int] = None
+        self._valid = False
+        self._end = StatusCode.display(StatusCode.END)
+
+        layer.featureAdded.connect(self._onFeatureAdded)
+        layer.featuresDeleted.connect(self._onFeaturesDeleted)
+        layer.committedFeaturesAdded.connect(self._onCommittedFeaturesAdded)
+        layer.afterRollBack.connect(self.invalidate)
+        if skipEnd:
+            layer.attributeValueChanged.connect(self._onAttributeValueChanged)
+
+    def last(self) -> Optional[QgsFeature]:
+        if not self._valid:
+            self._fid = self._scan()
+            self._valid = True
+        if self._fid is None:
+            return None
+        return self.layer.getFeature(self._fid)
+
+    def invalidate(self) -> None:
+        self._valid = False
+
+    def _candidate(self, feature: QgsFeature) -> None:
+        if self.skipEnd and feature["status"] == self._end:
+            return
+        if self._fid is None or _rank(feature.id()) > _rank(self._fid):
+            self._fid = feature.id()
+
+    def _onFeatureAdded(self, fid: int) -> None:
+        if self._valid:
+            self._candidate(self.layer.getFeature(fid))
+        elif fid < 0:
+            # a new feature is the most recent one, whatever the others
+            feature = self.layer.getFeature(fid)
+            if not (self.skipEnd and feature["status"] == self._end):
+                self._fid = fid
+                self._valid = True
+
+    def _onFeaturesDeleted(self, fids: List[int]) -> None:
+        if self._fid in fids:
+            self.invalidate()
+
+    def _onCommittedFeaturesAdded(
+        self, layerId: str, features: List[QgsFeature]
+    ) -> None:
+        if not self._valid:
+            return
+        # temporary (negative) ids are replaced by the ids of the table, in
+        # the order features were added: the last one is among the
+        # committed features if it was not committed yet
+        if self._fid is not None and self._fid < 0:
+            self._fid = None
+        for feature in features:
+            self._candidate(feature)
+        if self._fid is None:
+            self.invalidate()
+
+    def _onAttributeValueChanged(self, fid: int, idx: int, value) -> None:
+        if idx == self.layer.fields().indexOf("status"):
+            self.invalidate()
+
+    def _scan(self) -> Optional[int]:
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(
+            ["status"] if self.skipEnd else [], self.layer.fields()
+        )
+
+        fid = None
+        for feature in self.layer.getFeatures(request):
+            if self.skipEnd and feature["status"] == self._end:
+                continue
+            if fid is None or _rank(feature.id()) > _rank(fid):
+                fid = feature.id()
+        return fid
+
+
+_TAILS: Dict[Tuple[str, bool], SammoLayerTail] = {}
+
+
+def layerTail(layer: QgsVectorLayer, skipEnd: bool = False) -> SammoLayerTail:
+    """
+    Returns the tail of a layer, created on first use and dropped when the
+    layer is deleted.
+    """
+    key = (layer.id(), skipEnd)
+    if key not in _TAILS:
+        _TAILS[key] = SammoLayerTail(layer, skipEnd)
+        layer.willBeDeleted.connect(lambda: _TAILS.pop(key, None))
+    return _TAILS[key]
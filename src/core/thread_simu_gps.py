@@ -3,70 +3,160 @@
 __contact__ = "info@hytech-imaging.fr"
 __copyright__ = "Copyright (c) 2021 Hytech Imaging"
 
+import os
+import time
 import serial
-from time import sleep
-from typing import Optional
+import threading
+from typing import List, Optional
+from datetime import datetime, timedelta
 from .other_thread import WorkerForOtherThread, OtherThread
 from qgis.PyQt.QtCore import pyqtSignal
 from .session import SammoSession
-from datetime import datetime
+from . import nmea
+from .nmea_journal import parseSpeed, MAX_SPEED
+from .simu_track import SammoTrackSynthesizer, sentences
+
+# fixes are sent to the main thread at least every `BATCH_DURATION` seconds
+BATCH_DURATION = 0.1
+
+# maximum number of fixes of a batch, so that the main thread is not flooded
+# at maximum speed
+MAX_BATCH_FIXES = 500
 
 
 class WorkerSimuGps(WorkerForOtherThread):
-    addNewFeatureToGpsTableSignal = pyqtSignal(float, float, str, float, float)
+    # list of SammoFix
+    addNewFeaturesToGpsTableSignal = pyqtSignal(list)
 
     def __init__(
         self,
         testFilePath: str,
         session: SammoSession,
         indexOfNextGpsPoint: int,
+        rate: float = 1.0,
+        speed: float = 1.0,
+        seed: Optional[int] = None,
     ):
         super().__init__()
         self._gps: Optional[serial.Serial] = serial.Serial()
         self._testFilePath = testFilePath
         self._session: SammoSession = session
-        self._lines = None
+        self._file = None
         self._indexOfNextGpsPoint = indexOfNextGpsPoint
+        # simulated fixes per second, and simulated seconds per second
+        self._rate = rate
+        self._speed = speed
+        # a synthetic track is generated instead of reading the file when
+        # a seed is given
+        self._synthesizer: Optional[SammoTrackSynthesizer] = None
+        if seed is not None:
+            self._synthesizer = SammoTrackSynthesizer(rate=rate, seed=seed)
+        self._fusion = nmea.SammoFixFusion()
+        self._count = 0
+        self._start = None
+        # set by the main thread once the last batch is handled, a new batch
+        # is not sent before
+        self._handled = threading.Event()
+        self._handled.set()
+
+    def handled(self) -> None:
+        self._handled.set()
 
     def _toDoInsideLoop(self):
-        nbLines = len(self._lines)
-        for i in range(self._indexOfNextGpsPoint, nbLines):
-            sleep(1)
-            if self._isNeedToStop:
-                return
-
-            infos = self._lines[i].strip().split(",")
-            latitude_deg = infos[0]
-            longitude_deg = infos[1]
-            formattedDateTime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            speed = -9999.0
-            course = -9999.0
-            if len(infos) == 6 and infos[4] and infos[5]:
-                speed = infos[4]
-                course = infos[5]
-
-            self.addNewFeatureToGpsTableSignal.emit(
-                float(longitude_deg),
-                float(latitude_deg),
-                formattedDateTime,
-                float(speed),
-                float(course),
+        if not self._handled.wait(BATCH_DURATION):
+            return
+
+        fixes = []
+        deadline = time.monotonic() + BATCH_DURATION
+        while (
+            time.monotonic() < deadline
+            and len(fixes) < MAX_BATCH_FIXES
+            and not self._isNeedToStop
+        ):
+            # wait for the wall time of the next fix
+            if self._speed != MAX_SPEED:
+                due = self._start + self._count / (self._rate * self._speed)
+                if due > deadline:
+                    time.sleep(max(0.0, deadline - time.monotonic()))
+                    break
+                elif due > time.monotonic():
+                    time.sleep(due - time.monotonic())
+
+            dt = self._startDatetime + timedelta(
+                seconds=self._count / self._rate
             )
+            self._count += 1
+            fixes += self._nextFixes(dt)
+
+        if fixes:
+            self._handled.clear()
+            self.addNewFeaturesToGpsTableSignal.emit(fixes)
+            last = fixes[-1]
             self._log(
                 "GPS : longitude = {}°"
-                " - latitude = {}° - datetime = {}".format(
-                    longitude_deg, latitude_deg, formattedDateTime
+                " - latitude = {}° - {} fixes".format(
+                    last.longitude, last.latitude, len(fixes)
                 )
             )
-            self._indexOfNextGpsPoint = self._indexOfNextGpsPoint + 1
 
-        # always begins at the second line because the first is for titles
-        self._indexOfNextGpsPoint = 1
+    def _nextFixes(self, dt: datetime) -> List[nmea.SammoFix]:
+        if self._synthesizer:
+            # synthetic sentences go through the real parser and fusion
+            fixes = []
+            for line in sentences(dt, *self._synthesizer.next()):
+                fix = nmea.parse(line)
+                if fix:
+                    fixes += self._fusion.add(fix)
+            return fixes
+
+        infos = self._nextLine().strip().split(",")
+        fix = nmea.SammoFix("GP", "FIX")
+        fix.valid = True
+        fix.latitude = float(infos[0])
+        fix.longitude = float(infos[1])
+        if len(infos) == 6 and infos[4] and infos[5]:
+            fix.speed = float(infos[4])
+            fix.course = float(infos[5])
+        fix.hour = dt.hour
+        fix.minute = dt.minute
+        fix.second = dt.second
+        fix.millisecond = dt.microsecond // 1000
+        # simulated time runs ahead of the wall clock, so the date is sent
+        # too
+        fix.year = dt.year
+        fix.month = dt.month
+        fix.day = dt.day
+        return [fix]
+
+    def _nextLine(self) -> str:
+        line = self._file.readline()
+        if not line.strip():
+            # always begins at the second line because the first is for
+            # titles
+            self._openFile(1)
+            line = self._file.readline()
+        self._indexOfNextGpsPoint += 1
+        return line
+
+    def _openFile(self, index: int) -> None:
+        if self._file:
+            self._file.close()
+        self._file = open(self._testFilePath)
+        for _ in range(index):
+            self._file.readline()
+        self._indexOfNextGpsPoint = index
 
     def _onStart(self):
-        with open(self._testFilePath) as file:
-            self._lines = file.readlines()
+        if not self._synthesizer:
+            self._openFile(self._indexOfNextGpsPoint)
+        self._start = time.monotonic()
+        self._startDatetime = datetime.now()
+        self._count = 0
+
+    def run(self):
+        super().run()
+        if self._file:
+            self._file.close()
 
     @staticmethod
     def _removeQuotes(strValue: str) -> str:
@@ -77,7 +167,10 @@ class WorkerSimuGps(WorkerForOtherThread):
 
 
 class ThreadSimuGps(OtherThread):
-    frame = pyqtSignal(float, float, int, int, int, float, float)
+    # same frame as SammoGpsReader, with the simulated date
+    frame = pyqtSignal(
+        float, float, int, int, int, float, float, int, int, int, int
+    )
 
     def __init__(self, session: SammoSession, testFilePath: str):
         super().__init__()
@@ -87,19 +180,47 @@ class ThreadSimuGps(OtherThread):
         self.indexOfNextGpsPoint: int = 1
         self.worker = None
 
+        # SAMMO_SIMU_GPS_RATE=20 (fixes per simulated second)
+        # SAMMO_SIMU_GPS_SPEED=1|10|100|max (time multiplier)
+        # SAMMO_SIMU_GPS_SEED=<int> (synthetic track instead of the file)
+        self.rate = float(os.environ.get("SAMMO_SIMU_GPS_RATE", 1))
+        self.speed = parseSpeed(os.environ.get("SAMMO_SIMU_GPS_SPEED", "1"))
+        seed = os.environ.get("SAMMO_SIMU_GPS_SEED")
+        self.seed = int(seed) if seed else None
+
     def start(self):
         self.worker = WorkerSimuGps(
             self._testFilePath,
             self._session,
             self.indexOfNextGpsPoint,
+            self.rate,
+            self.speed,
+            self.seed,
         )
-        self.worker.addNewFeatureToGpsTableSignal.connect(self.newFrame)
+        self.worker.addNewFeaturesToGpsTableSignal.connect(self.newFrames)
         super()._start(self.worker)
 
     def stop(self):
         self.indexOfNextGpsPoint = self.worker._indexOfNextGpsPoint
         super().stop()
 
+    def newFrames(self, fixes: List[nmea.SammoFix]) -> None:
+        for fix in fixes:
+            self.frame.emit(
+                fix.longitude,
+                fix.latitude,
+                fix.hour,
+                fix.minute,
+                fix.second,
+                fix.speed,
+                fix.course,
+                fix.millisecond,
+                fix.year,
+                fix.month,
+                fix.day,
+            )
+        self.worker.handled()
+
     @staticmethod
     def getDatetime(line: str) -> (int, int, int):
         # "2021-10-28 15:32:10"
@@ -110,22 +231,6 @@ class ThreadSimuGps(OtherThread):
         secondes = int(time[2])
         return hour, minutes, secondes
 
-    def newFrame(
-        self,
-        longitude_deg: float,
-        latitude_deg: float,
-        formattedDateTime: str,
-        speed: float,
-        course: float,
-    ):
-        self.frame.emit(
-            longitude_deg,
-            latitude_deg,
-            *self.getDatetime(formattedDateTime),
-            speed,
-            course
-        )
-
     @staticmethod
     def nowToString() -> str:
         dateTimeObj = datetime.now()
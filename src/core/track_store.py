@@ -0,0 +1,148 @@
+# coding: utf8
+
+__contact__ = "info@hytech-imaging.fr"
+__copyright__ = "Copyright (c) 2022 Hytech Imaging"
+
+import os
+import sys
+import time
+from array import array
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# columns of the store, each one kept in memory as a packed array of doubles
+COLUMNS = ["epoch", "longitude", "latitude", "speed", "course"]
+
+# number of fixes per chunk file (one hour at 1 Hz)
+CHUNK_SIZE = 3600
+
+# the opened chunk is written to disk at least every `FLUSH_INTERVAL` seconds
+FLUSH_INTERVAL = 10
+
+CHUNK_SUFFIX = ".trk"
+
+
+class SammoTrackStore:
+    """
+    Append-only columnar store for the full-rate GPS track.
+
+    Fixes are accumulated in packed arrays and written in chunk files of
+    `CHUNK_SIZE` fixes. A chunk file contains one record per fix, made of
+    the values of each column as little-endian doubles, so the number of
+    fixes of a chunk is deduced from its size. Fixes are only appended to
+    the last chunk, and a record truncated by a crash is ignored.
+    """
+
+    def __init__(self, directory: Path, chunkSize: int = CHUNK_SIZE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.chunkSize = chunkSize
+
+        self._chunks = sorted(self.directory.glob(f"*{CHUNK_SUFFIX}"))
+        self._columns = self._newColumns()
+        self._count = 0
+        # number of fixes of the opened chunk already in its file
+        self._written = 0
+        self._lastFlush = time.monotonic()
+
+        # reopen the last chunk if it's not full
+        if self._chunks:
+            columns = self._readChunk(self._chunks[-1])
+            if len(columns[0]) < self.chunkSize:
+                self._columns = columns
+                self._chunks = self._chunks[:-1]
+                self._written = len(columns[0])
+                # drop a record truncated by a crash
+                os.truncate(
+                    self._currentChunkPath(),
+                    self._written * len(COLUMNS) * 8,
+                )
+        self._count = len(self._chunks) * self.chunkSize + len(
+            self._columns[0]
+        )
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(
+        self,
+        epoch: float,
+        longitude: float,
+        latitude: float,
+        speed: float = -9999.0,
+        course: float = -9999.0,
+    ) -> None:
+        for column, value in zip(
+            self._columns, (epoch, longitude, latitude, speed, course)
+        ):
+            column.append(value)
+        self._count += 1
+
+        if len(self._columns[0]) >= self.chunkSize:
+            self._appendChunk(self._currentChunkPath())
+            self._chunks.append(self._currentChunkPath())
+            self._columns = self._newColumns()
+            self._written = 0
+        elif time.monotonic() - self._lastFlush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        self._lastFlush = time.monotonic()
+        self._appendChunk(self._currentChunkPath())
+
+    def columns(self) -> List[array]:
+        """
+        Returns the whole track as a list of arrays, in `COLUMNS` order.
+        """
+        columns = self._newColumns()
+        for chunk in self._chunks:
+            for column, values in zip(columns, self._readChunk(chunk)):
+                column.extend(values)
+        for column, values in zip(columns, self._columns):
+            column.extend(values)
+        return columns
+
+    def last(self) -> Optional[Tuple[float, float, float, float, float]]:
+        if self._columns[0]:
+            return tuple(column[-1] for column in self._columns)
+        if self._chunks:
+            return tuple(
+                column[-1] for column in self._readChunk(self._chunks[-1])
+            )
+        return None
+
+    def _currentChunkPath(self) -> Path:
+        return self.directory / f"{len(self._chunks):08d}{CHUNK_SUFFIX}"
+
+    def _appendChunk(self, path: Path) -> None:
+        """
+        Appends the fixes not written yet to the chunk file
+        """
+        count = len(self._columns[0])
+        if count <= self._written:
+            return
+
+        records = array("d")
+        for i in range(self._written, count):
+            records.extend(column[i] for column in self._columns)
+        if sys.byteorder == "big":
+            records.byteswap()
+        with open(path, "ab") as f:
+            records.tofile(f)
+        self._written = count
+
+    @staticmethod
+    def _readChunk(path: Path) -> List[array]:
+        data = array("d")
+        with open(path, "rb") as f:
+            content = f.read()
+        size = len(COLUMNS) * data.itemsize
+        data.frombytes(content[: len(content) // size * size])
+        if sys.byteorder == "big":
+            data.byteswap()
+
+        return [data[i :: len(COLUMNS)] for i in range(len(COLUMNS))]
+
+    @staticmethod
+    def _newColumns() -> List[array]:
+        return [array("d") for _ in COLUMNS]
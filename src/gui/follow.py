@@ -0,0 +1,149 @@
+# coding: utf8
+
+__contact__ = "info@hytech-imaging.fr"
+__copyright__ = "Copyright (c) 2022 Hytech Imaging"
+
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from qgis.PyQt.QtGui import QColor
+from qgis.gui import QgsMapCanvas, QgsVertexMarker, QgsRubberBand
+from qgis.core import (
+    QgsProject,
+    QgsPointXY,
+    QgsSettings,
+    QgsWkbTypes,
+    QgsRectangle,
+    QgsCoordinateTransform,
+    QgsCoordinateReferenceSystem,
+)
+
+# the map is panned when the boat leaves the central part of the canvas,
+# whose size is `INNER_RATIO` times the visible extent
+INNER_RATIO = 0.6
+
+# minimum delay in seconds between two pans of the map
+PAN_INTERVAL = 5
+
+# maximum number of points of the live track drawn on the canvas
+TRACK_SIZE = 2000
+
+
+def canvasPoint(
+    canvas: QgsMapCanvas, longitude: float, latitude: float
+) -> QgsPointXY:
+    point = QgsPointXY(longitude, latitude)
+    crs = canvas.mapSettings().destinationCrs()
+    if crs.isValid() and crs.authid() != "EPSG:4326":
+        point = QgsCoordinateTransform(
+            QgsCoordinateReferenceSystem.fromEpsgId(4326),
+            crs,
+            QgsProject.instance(),
+        ).transform(point)
+    return point
+
+
+class SammoMapFollower:
+    def __init__(self, canvas: QgsMapCanvas):
+        self.canvas = canvas
+        self.marker: QgsVertexMarker = None
+        self._lastPan = 0.0
+
+        settings = QgsSettings()
+        self.innerRatio = float(
+            settings.value("Sammo/SammoMapFollower/InnerRatio", INNER_RATIO)
+        )
+        self.panInterval = float(
+            settings.value("Sammo/SammoMapFollower/PanInterval", PAN_INTERVAL)
+        )
+
+    def update(self, longitude: float, latitude: float) -> None:
+        point = canvasPoint(self.canvas, longitude, latitude)
+
+        # moving the marker only repaints the canvas item, not the layers
+        if not self.marker:
+            self.marker = self._createMarker()
+        self.marker.setCenter(point)
+
+        inner = QgsRectangle(self.canvas.extent())
+        inner.scale(self.innerRatio)
+        if inner.contains(point):
+            return
+
+        now = time.monotonic()
+        if now - self._lastPan < self.panInterval:
+            return
+        self._lastPan = now
+        self.canvas.setCenter(point)
+
+    def unload(self) -> None:
+        if self.marker:
+            self.canvas.scene().removeItem(self.marker)
+            self.marker = None
+
+    def _createMarker(self) -> QgsVertexMarker:
+        marker = QgsVertexMarker(self.canvas)
+        marker.setIconType(QgsVertexMarker.ICON_CIRCLE)
+        marker.setColor(QColor(219, 30, 42))
+        marker.setFillColor(QColor(255, 255, 255))
+        marker.setIconSize(12)
+        marker.setPenWidth(3)
+        return marker
+
+
+class SammoLiveTrack:
+    """
+    Recent part of the GPS track drawn as a canvas item, fed directly by
+    the fixes. The number of points is bounded: once `TRACK_SIZE` points
+    are reached, the oldest half is dropped and `reload` is called so the
+    persisted GPS layer is repainted.
+    """
+
+    def __init__(
+        self,
+        canvas: QgsMapCanvas,
+        reload: Optional[Callable[[], None]] = None,
+    ):
+        self.canvas = canvas
+        self.reload = reload
+        self.band: QgsRubberBand = None
+        self.size = int(
+            QgsSettings().value("Sammo/SammoLiveTrack/Size", TRACK_SIZE)
+        )
+        self._points = deque()
+
+    def add(self, longitude: float, latitude: float) -> None:
+        if not self.band:
+            self.band = self._createBand()
+
+        point = canvasPoint(self.canvas, longitude, latitude)
+        self._points.append(point)
+        if len(self._points) <= self.size:
+            self.band.addPoint(point)
+            return
+
+        for _ in range(len(self._points) - self.size // 2):
+            self._points.popleft()
+        self.band.reset(QgsWkbTypes.LineGeometry)
+        for i, point in enumerate(self._points):
+            self.band.addPoint(point, i == len(self._points) - 1)
+        if self.reload:
+            self.reload()
+
+    def reset(self) -> None:
+        self._points.clear()
+        if self.band:
+            self.band.reset(QgsWkbTypes.LineGeometry)
+
+    def unload(self) -> None:
+        if self.band:
+            self.canvas.scene().removeItem(self.band)
+            self.band = None
+        self._points.clear()
+
+    def _createBand(self) -> QgsRubberBand:
+        band = QgsRubberBand(self.canvas, QgsWkbTypes.LineGeometry)
+        band.setColor(QColor(219, 30, 42))
+        band.setWidth(2)
+        return band
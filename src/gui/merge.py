@@ -6,7 +6,7 @@ __copyright__ = "Copyright (c) 2021 Hytech Imaging"
 import os
 from pathlib import Path
 from shutil import copyfile
-from typing import Optional
+from typing import List, Optional
 
 from qgis.PyQt import uic
 from qgis.utils import iface
@@ -117,6 +117,9 @@ class SammoMergeDialog(QDialog, FORM_CLASS):
         QgsApplication.taskManager().addTask(self.task)
 
     def after_task(self):
+        if self.task.warningMsg:
+            iface.messageBar().pushWarning("MergeTask", self.task.warningMsg)
+
         if self.task.errorMsg:
             iface.messageBar().pushWarning("MergeTask", self.task.errorMsg)
             self.ok.setText("Failed")
@@ -145,6 +148,8 @@ class SammoMergeTask(QgsTask):
         self.sessionMergedDir = sessionMergedDir
         self.date = date
         self.errorMsg = ""
+        self.warningMsg = ""
+        self.sessions: List[SammoSession] = []
 
     def run(self) -> bool:
         try:
@@ -152,20 +157,39 @@ class SammoMergeTask(QgsTask):
         except Exception as e:
             self.errorMsg = ",".join([str(i) for i in e.args])
             return False
+        finally:
+            # layers opened by this thread are not kept after the merge
+            for session in self.sessions:
+                session.close()
+            self.sessions = []
         return True
 
     def merge(self) -> None:
         # open input session
         sessionA = SammoSession()
+        self.sessions.append(sessionA)
         sessionA.init(self.sessionADir, load=False)
-        sessionA.effortCheck(sessionA.environmentLayer)
 
         sessionB = SammoSession()
+        self.sessions.append(sessionB)
         sessionB.init(self.sessionBDir, load=False)
-        sessionB.effortCheck(sessionB.environmentLayer)
+
+        # effort issues of inputs are reported, but don't prevent the merge
+        for session in (sessionA, sessionB):
+            report = session.effortCheck(
+                session.environmentLayer,
+                session.sightingsLayer,
+                session.followersLayer,
+            )
+            if report.issues:
+                self.warningMsg += (
+                    "Issues detected in effort status of "
+                    f"{session.db.directory}:\n{report.text()}\n"
+                )
 
         # create output session
         sessionOutput = SammoSession()
+        self.sessions.append(sessionOutput)
         sessionOutput.init(self.sessionMergedDir, load=False)
 
         # copy sound files to output session
@@ -8,7 +8,7 @@ from pathlib import Path
 from qgis.PyQt import uic
 from qgis.utils import iface
 from qgis.PyQt.QtCore import QObject, QDir, pyqtSignal
-from qgis.core import QgsVectorLayerUtils, QgsVectorLayer, QgsFeature
+from qgis.core import QgsVectorLayerUtils, QgsVectorLayer
 from qgis.PyQt.QtWidgets import (
     QAction,
     QToolBar,
@@ -20,6 +20,7 @@ from qgis.PyQt.QtWidgets import (
 
 
 from ..core import utils
+from ..core.bulk import bulkLoad, GEOMETRY
 from ..core.session import SammoSession
 
 FORM_CLASS, _ = uic.loadUiType(Path(__file__).parent / "ui/settings.ui")
@@ -140,24 +141,13 @@ class SammoSettingsDialog(QDialog, FORM_CLASS):
             )
             return
 
-        self.session.transectLayer.startEditing()
-        for importedFt in lyr.getFeatures():
-            ft = QgsFeature(self.session.transectLayer.fields())
-            ft.setGeometry(importedFt.geometry())
-            for field in ft.fields():
-                if field.name() == "fid":
-                    continue
-                elif field.name() in lyr.fields().names():
-                    if field.type() is not lyr.fields()[field.name()].type():
-                        if field.typeName() == "Integer":
-                            value = int(importedFt[field.name()])
-                        elif field.typeName() == "Real":
-                            value = float(importedFt[field.name()])
-                        else:
-                            value = importedFt[field.name()]
-                    else:
-                        value = importedFt[field.name()]
-                    ft[field.name()] = value
-            self.session.transectLayer.addFeature(ft)
-        self.session.transectLayer.commitChanges()
+        names = lyr.fields().names()
+        rows = [
+            {
+                **dict(zip(names, importedFt.attributes())),
+                GEOMETRY: importedFt.geometry(),
+            }
+            for importedFt in lyr.getFeatures()
+        ]
+        bulkLoad(self.session.transectLayer, rows, "transect import")
         self.reloadTables.emit()
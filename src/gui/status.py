@@ -35,6 +35,9 @@ class StatusWidget(QFrame, FORM_CLASS):
         self.setupUi(self)
         self.record.clicked.connect(self.interrupt)
         self.gpsButton.clicked.connect(self.activateGPS)
+        self.durability = QLabel(self)
+        self.durability.setAlignment(Qt.AlignCenter | Qt.AlignVCenter)
+        self.verticalLayout.addWidget(self.durability)
         self.init()
 
     def updateNeedSave(self, status: bool):
@@ -48,6 +51,9 @@ class StatusWidget(QFrame, FORM_CLASS):
         px = pixmap(icon, QSize(64, 64))
         self.save.setPixmap(px)
 
+    def updateDurability(self, profile: str):
+        self.durability.setText(f"Database: {profile}" if profile else "")
+
     def updateRecording(self, status: bool):
         self.record.setStyleSheet(self._styleSheet(self.record, status))
 
@@ -179,6 +185,7 @@ class SammoStatusDock(QDockWidget):
         self._widget.updateEffort(self._isEffortOn)
         self._widget.updateRecording(self.isSoundRecordingOn)
         self._widget.updateNeedSave(self.session.needsSaving())
+        self._widget.updateDurability(self.session.db.durability)
 
     def updateGpsInfo(
         self, longitude: float, latitude: float, speed: float, course: float